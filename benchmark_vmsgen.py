@@ -0,0 +1,613 @@
+#!/usr/bin/env python
+
+# Copyright 2016-2019 VMware, Inc.
+# SPDX-License-Identifier: MIT
+
+'''
+Benchmarks for the performance sensitive parts of vmsgen.
+Run python benchmark_vmsgen.py -h for the list of benchmarks.
+'''
+from __future__ import print_function
+import argparse
+import collections
+import contextlib
+import copy
+import gc
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import timeit
+import tracemalloc
+from http import server
+from types import SimpleNamespace
+import vmsgen
+
+
+def build_synthetic_spec(path_count, definition_count):
+    """
+    Builds path and definition dictionaries shaped like the ones of the vcenter package.
+    """
+    type_dict = {}
+    for index in range(definition_count):
+        type_dict['com.vmware.vcenter.mock%d.info' % index] = {
+            'type': 'object',
+            'properties': {
+                'name': {'description': 'Name of com.vmware.vcenter.mock%d.' % index, 'type': 'string'},
+                'items': {'description': 'Items.', 'type': 'array',
+                          'items': {'$ref': '#/definitions/com.vmware.vcenter.mock%d.info' % (index // 2)}},
+                'state': {'description': 'State.', '$ref': '#/definitions/com.vmware.vcenter.mock.state',
+                          'required': False}
+            },
+            'required': ['name', 'items']
+        }
+    type_dict['com.vmware.vcenter.mock.state'] = {'type': 'string', 'description': 'State.', 'enum': ['ON', 'OFF']}
+    path_dict = {}
+    for index in range(path_count):
+        path = '/com/vmware/vcenter/mock%d/{mock}' % index
+        operations = {}
+        for method, operation_id in (('get', 'get'), ('delete', 'delete'), ('patch', 'update')):
+            operations[method] = {
+                'tags': ['mock%d' % index], 'method': method, 'path': path,
+                'summary': 'Operates on com.vmware.vcenter.mock%d.' % index,
+                'operationId': operation_id,
+                'parameters': [{'in': 'path', 'name': 'mock', 'type': 'string', 'required': True,
+                                'description': 'Identifier of com.vmware.vcenter.mock.'}],
+                'responses': {200: {'description': 'ok', 'schema': {
+                    '$ref': '#/definitions/com.vmware.vcenter.mock%d.info' % (index % definition_count)}},
+                              404: {'description': 'not found', 'schema': {
+                                  '$ref': '#/definitions/com.vmware.vapi.std.errors.not_found_error'}}}
+            }
+        path_dict[path] = operations
+        path_dict[path + '?~action=mock'] = {'post': dict(operations['patch'], method='post', operationId='mock')}
+    return path_dict, type_dict
+
+
+def builtin_type(name):
+    return SimpleNamespace(category='BUILTIN', builtin_type=name)
+
+
+def user_defined_type(resource_type, resource_id):
+    return SimpleNamespace(category='USER_DEFINED', user_defined_type=SimpleNamespace(
+        resource_type=resource_type, resource_id=resource_id))
+
+
+def generic_type(generic, element_type=None, map_key_type=None, map_value_type=None):
+    return SimpleNamespace(category='GENERIC', generic_instantiation=SimpleNamespace(
+        generic_type=generic, element_type=element_type, map_key_type=map_key_type, map_value_type=map_value_type))
+
+
+def nest_type(metamodel_type, depth):
+    """
+    Wraps a type in depth levels of generics, cycling through OPTIONAL, LIST, MAP and SET.
+    """
+    for level in range(depth):
+        generic = ('OPTIONAL', 'LIST', 'MAP', 'SET')[level % 4]
+        if generic == 'MAP':
+            metamodel_type = generic_type(generic, map_key_type=builtin_type('STRING'), map_value_type=metamodel_type)
+        else:
+            metamodel_type = generic_type(generic, element_type=metamodel_type)
+    return metamodel_type
+
+
+def field_info(name, metamodel_type, metadata=None):
+    return SimpleNamespace(name=name, type=metamodel_type, documentation='Field %s of com.vmware.bench.' % name,
+                           metadata=metadata or {})
+
+
+def request_mapping(url, method):
+    return {'RequestMapping': SimpleNamespace(elements={'value': SimpleNamespace(string_value=url),
+                                                        'method': SimpleNamespace(string_value=method)})}
+
+
+def build_synthetic_metamodel(service_count, operation_count, field_count, depth, recursion, base_url):
+    """
+    Builds metamodel dictionaries shaped like the ones populate_dicts fills in, made of SimpleNamespace objects
+    with the attributes vmsgen reads.
+    Every service has an info structure with field_count fields, a few of them of depth nested generics.
+    Info structures also refer to a chain of recursion structures, which refer to each other in a cycle, and to
+    structures shared by all services. Every other service is only mapped through ?~method=OPTIONS.
+    :return: enumeration_dict, structure_dict, service_dict, service_urls_map and a dict which maps
+     the rest navigation service urls to their OPTIONS document
+    """
+    structure = 'com.vmware.vapi.structure'
+    enumeration = 'com.vmware.vapi.enumeration'
+    enumeration_dict = {'com.vmware.bench.state': SimpleNamespace(
+        documentation='State of com.vmware.bench.', values=[SimpleNamespace(value=value) for value in ('ON', 'OFF')])}
+    structure_dict = {}
+    for error_id in ('com.vmware.vapi.std.errors.not_found', 'com.vmware.vapi.std.errors.unauthorized'):
+        structure_dict[error_id] = SimpleNamespace(fields=[
+            field_info('messages', generic_type('LIST', element_type=builtin_type('STRING')))])
+    errors = [SimpleNamespace(structure_id=error_id, documentation='Error ' + error_id)
+              for error_id in sorted(structure_dict)]
+    shared_ids = ['com.vmware.bench.common.item%d' % index for index in range(max(1, field_count // 2))]
+    for index, shared_id in enumerate(shared_ids):
+        structure_dict[shared_id] = SimpleNamespace(fields=[
+            field_info('name', builtin_type('STRING')), field_info('size', builtin_type('LONG')),
+            field_info('state', user_defined_type(enumeration, 'com.vmware.bench.state'))])
+    recursion_ids = ['com.vmware.bench.common.node%d' % index for index in range(recursion)]
+    for index, recursion_id in enumerate(recursion_ids):
+        next_id = recursion_ids[(index + 1) % recursion]
+        structure_dict[recursion_id] = SimpleNamespace(fields=[
+            field_info('name', builtin_type('STRING')),
+            field_info('next', generic_type('OPTIONAL', element_type=user_defined_type(structure, next_id))),
+            field_info('children', generic_type('LIST', element_type=user_defined_type(structure, next_id)))])
+
+    service_dict = {}
+    service_urls_map = {}
+    options_documents = {}
+    builtins = ('STRING', 'LONG', 'BOOLEAN', 'DATE_TIME', 'URI', 'DOUBLE', 'ID', 'SECRET')
+    for service_index in range(service_count):
+        service_id = 'com.vmware.bench.service%d' % service_index
+        info_id = service_id + '.info'
+        fields = []
+        for field_index in range(field_count):
+            kind = field_index % 4
+            if kind == 0:
+                metamodel_type = builtin_type(builtins[field_index % len(builtins)])
+            elif kind == 1:
+                metamodel_type = user_defined_type(structure, shared_ids[field_index % len(shared_ids)])
+            elif kind == 2:
+                metamodel_type = nest_type(user_defined_type(structure, shared_ids[-1 - field_index % len(shared_ids)]),
+                                           depth)
+            else:
+                metamodel_type = nest_type(builtin_type('STRING'), depth)
+            fields.append(field_info('field%d' % field_index, metamodel_type))
+        if recursion_ids:
+            fields.append(field_info('node', generic_type('OPTIONAL', element_type=user_defined_type(
+                structure, recursion_ids[service_index % recursion]))))
+        structure_dict[info_id] = SimpleNamespace(fields=fields)
+        structure_dict[service_id + '.create_spec'] = SimpleNamespace(fields=fields[:max(1, field_count // 2)])
+
+        url = '/bench/service%d' % service_index
+        item_param = field_info('item', builtin_type('ID'))
+        operation_kinds = [('get', 'GET', url + '/{item}', [item_param], user_defined_type(structure, info_id)),
+                           ('list', 'GET', url, [field_info('filter', generic_type('OPTIONAL', builtin_type(
+                               'STRING')))], generic_type('LIST', element_type=user_defined_type(structure, info_id))),
+                           ('create', 'POST', url, [field_info('spec', user_defined_type(
+                               structure, service_id + '.create_spec'))], builtin_type('ID')),
+                           ('delete', 'DELETE', url + '/{item}', [item_param], builtin_type('VOID'))]
+        operations = {}
+        options_document = []
+        with_request_mapping = service_index % 2 == 0
+        for operation_index in range(operation_count):
+            if operation_index < len(operation_kinds):
+                name, method, operation_url, params, output_type = operation_kinds[operation_index]
+            else:
+                # the first action is merged into the path of get and delete, the others have paths of their own.
+                name = 'action%d' % operation_index
+                operation_url = url + '/{item}' + ('?~action=' if operation_index == len(operation_kinds) else '/') \
+                    + name
+                method, params, output_type = 'POST', [item_param], builtin_type('VOID')
+            metadata = request_mapping(operation_url, method) if with_request_mapping else {}
+            operations[name] = SimpleNamespace(
+                name=name, documentation='Operation %s of %s.' % (name, service_id), params=params, errors=errors,
+                output=SimpleNamespace(type=output_type, documentation='Result of ' + name), metadata=metadata)
+            options_document.append({'service': service_id, 'name': name,
+                                     'links': [{'href': base_url + operation_url, 'method': method}]})
+        service_dict[service_id] = SimpleNamespace(operations=operations)
+        service_url = base_url + url
+        service_urls_map[service_url] = service_id
+        if not with_request_mapping:
+            options_documents[service_url] = options_document
+    return enumeration_dict, structure_dict, service_dict, service_urls_map, options_documents
+
+
+class OptionsStubHandler(server.BaseHTTPRequestHandler):
+    """
+    Answers ?~method=OPTIONS requests from the documents of the server, like the rest navigation service.
+    """
+    # keep-alive, as vCenter Server
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would wait for delayed acks.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        document = self.server.options_documents.get(self.server.origin + self.path.partition('?')[0])
+        body = json.dumps({'value': document}).encode('utf-8')
+        self.send_response(200 if document is not None else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class OptionsStubServer(server.ThreadingHTTPServer):
+    # the default listen backlog of 5 drops connections of concurrent prefetches.
+    request_queue_size = 64
+    daemon_threads = True
+
+
+def start_options_stub(options_documents):
+    """
+    Serves the OPTIONS documents on an ephemeral local port.
+    :return: the server, whose base_url the service urls have to start with
+    """
+    stub = OptionsStubServer(('127.0.0.1', 0), OptionsStubHandler)
+    stub.origin = 'http://127.0.0.1:%d' % stub.server_address[1]
+    stub.base_url = stub.origin + '/rest'
+    stub.options_documents = options_documents
+    thread = threading.Thread(target=stub.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return stub
+
+
+class PhaseTimer(object):
+    """
+    Measures the time spent in vmsgen functions by rebinding them to timing wrappers
+    while the timer is active. The functions must not call each other.
+    """
+
+    def __init__(self, phases):
+        self.phases = phases
+        self.seconds = collections.OrderedDict((phase, 0.0) for phase in phases)
+        self.originals = {}
+
+    def wrap(self, phase, function):
+        def timed(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[phase] += timeit.default_timer() - start
+        return timed
+
+    def __enter__(self):
+        for phase, function_name in self.phases.items():
+            self.originals[function_name] = getattr(vmsgen, function_name)
+            setattr(vmsgen, function_name, self.wrap(phase, self.originals[function_name]))
+        return self
+
+    def __exit__(self, *exc_info):
+        for function_name, function in self.originals.items():
+            setattr(vmsgen, function_name, function)
+
+
+def reset_vmsgen_caches():
+    """
+    Starts from the state of a fresh run, repeated runs would otherwise be served from the in-process caches.
+    """
+    vmsgen.SCHEMA_CACHE = vmsgen.SchemaCache()
+    for cache in (vmsgen.MODEL_NAMES, vmsgen.TITLES, vmsgen.URL_TEMPLATES, vmsgen.TYPE_DIGESTS,
+                  vmsgen.TYPE_REFERENCES):
+        cache.clear()
+
+
+GENERATE_PHASES = collections.OrderedDict([('options', 'prefetch_service_operations'), ('convert', 'get_path'),
+                                           ('post process', 'post_process_spec'),
+                                           ('query paths', 'remove_query_params'),
+                                           ('write', 'write_swagger_to_file')])
+
+
+def benchmark_generate(args):
+    """
+    Feeds a synthetic metamodel through prefetch_service_operations and process_service_urls, like main does,
+    with the OPTIONS documents served by a local stub,
+    and reports the time per phase and the peak memory for every --scale multiple of --services.
+    Time per operation should stay flat as the scale grows.
+    """
+    output_dir = tempfile.mkdtemp()
+    stub = start_options_stub({})
+    error_map = vmsgen.build_error_map()
+    try:
+        print('%-8s %10s %10s ' % ('services', 'operations', 'seconds') + ' '.join(
+            '%12s' % phase for phase in GENERATE_PHASES) + ' %12s %10s %10s' % ('other', 'us/op', 'peak MB'))
+        for scale in args.scale:
+            service_count = args.services * scale
+            enumeration_dict, structure_dict, service_dict, service_urls_map, options_documents = \
+                build_synthetic_metamodel(service_count, args.operations, args.fields, args.depth, args.recursion,
+                                          stub.base_url)
+            stub.options_documents = options_documents
+            service_urls = sorted(service_urls_map)
+
+            def generate():
+                reset_vmsgen_caches()
+                service_operations_dict = vmsgen.prefetch_service_operations(service_urls, service_dict,
+                                                                             service_urls_map)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    vmsgen.process_service_urls('bench', service_urls, output_dir, structure_dict, enumeration_dict,
+                                                service_dict, service_urls_map, error_map, stub.base_url,
+                                                service_operations_dict)
+
+            best = None
+            for _ in range(args.repeat):
+                with PhaseTimer(GENERATE_PHASES) as timer:
+                    start = timeit.default_timer()
+                    generate()
+                    elapsed = timeit.default_timer() - start
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, timer.seconds)
+            # tracemalloc slows everything down, peak memory is measured in a separate run.
+            tracemalloc.start()
+            try:
+                generate()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            elapsed, seconds = best
+            operation_count = service_count * args.operations
+            print('%-8d %10d %10.3f ' % (service_count, operation_count, elapsed) + ' '.join(
+                '%12.3f' % phase_seconds for phase_seconds in seconds.values()) + ' %12.3f %10.1f %10.1f' % (
+                elapsed - sum(seconds.values()), elapsed / operation_count * 1e6, peak / 1e6))
+    finally:
+        stub.shutdown()
+        stub.server_close()
+        shutil.rmtree(output_dir)
+
+
+def time_best(function, repeat):
+    """
+    Returns the best wall time of repeat runs of function.
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def time_best_with_setup(setup, function, repeat):
+    """
+    Returns the best wall time of repeat runs of function, called with the result of a fresh setup() every time.
+    Like timeit, garbage collection is disabled while function runs.
+    """
+    best = None
+    for _ in range(repeat):
+        arguments = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = timeit.default_timer()
+            function(*arguments)
+            elapsed = timeit.default_timer() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def legacy_cleanup(path_dict, type_dict):
+    """
+    The cleanup step of the post processing before post_process_spec.
+    """
+    for type_object in type_dict.values():
+        for property_value in type_object.get('properties', {}).values():
+            if isinstance(property_value.get('required'), bool):
+                del property_value['required']
+    for path_value in path_dict.values():
+        for method_value in path_value.values():
+            method_value.pop('path', None)
+            method_value.pop('method', None)
+
+
+def legacy_remove_com_vmware_from_dict(swagger_obj, depth=0, keys_list=None):
+    """
+    The walk which removed 'com.vmware.' from the model names and their references, and replaced $ with _,
+    before model names were final when the spec is built.
+    """
+    if keys_list is None:
+        keys_list = []
+    if isinstance(swagger_obj, dict):
+        if '$ref' in swagger_obj and 'required' in swagger_obj:
+            del swagger_obj['required']
+        for key, item in swagger_obj.items():
+            if isinstance(item, str):
+                if key in ('$ref', 'summary', 'description'):
+                    item = item.replace('com.vmware.', '')
+                    if key == '$ref':
+                        item = item.replace('$', '_')
+                    swagger_obj[key] = item
+            elif isinstance(item, list):
+                for itm in item:
+                    legacy_remove_com_vmware_from_dict(itm, depth + 1, keys_list)
+            elif isinstance(item, dict):
+                if depth == 0 and isinstance(key, str) and (key.startswith('com.vmware.') or '$' in key):
+                    keys_list.append(key)
+                legacy_remove_com_vmware_from_dict(item, depth + 1, keys_list)
+    elif isinstance(swagger_obj, list):
+        for itm in swagger_obj:
+            legacy_remove_com_vmware_from_dict(itm, depth + 1)
+    if depth == 0:
+        while keys_list:
+            old_key = keys_list.pop()
+            swagger_obj[old_key.replace('com.vmware.', '').replace('$', '_')] = swagger_obj.pop(old_key)
+
+
+def benchmark_postprocess(args):
+    """
+    Compares the separate post processing walks, renaming models in the paths and in the definitions,
+    with post_process_spec, which doesn't need to since model names are final when the spec is built.
+    """
+    path_dict, type_dict = build_synthetic_spec(args.paths, args.definitions)
+
+    def setup():
+        return copy.deepcopy(path_dict), copy.deepcopy(type_dict)
+
+    def separate_walks(paths, types):
+        legacy_cleanup(paths, types)
+        legacy_remove_com_vmware_from_dict(paths)
+        if vmsgen.GENERATE_UNIQUE_OP_IDS:
+            vmsgen.create_unique_op_ids(paths)
+        legacy_remove_com_vmware_from_dict(types)
+
+    def single_pass(paths, types):
+        vmsgen.post_process_spec(paths, types)
+
+    try:
+        print('%-32s %10s %10s' % ('post processing', 'seconds', 'with -uo'))
+        for name, function in (('separate walks (baseline)', separate_walks), ('post_process_spec', single_pass)):
+            timings = []
+            for unique_op_ids in (False, True):
+                vmsgen.GENERATE_UNIQUE_OP_IDS = unique_op_ids
+                timings.append(time_best_with_setup(setup, function, args.repeat))
+            print('%-32s %10.3f %10.3f' % tuple([name] + timings))
+    finally:
+        vmsgen.GENERATE_UNIQUE_OP_IDS = False
+
+
+def legacy_create_unique_op_ids(path_dict):
+    """
+    create_unique_op_ids as it was before the OperationIdIndex: a list lookup per operation,
+    colliding operations keep their original id.
+    """
+    op_id_list = list(vmsgen.RESERVED_OP_IDS)
+    for path, http_operation in path_dict.items():
+        for http_method, operation_dict in http_operation.items():
+            op_id_val = vmsgen.create_camelized_op_id(path, http_method, operation_dict)
+            if op_id_val not in op_id_list:
+                operation_dict['operationId'] = op_id_val
+                op_id_list.append(op_id_val)
+
+
+def benchmark_op_ids(args):
+    """
+    Compares the list based operation id uniqueness check with the OperationIdIndex.
+    """
+    path_dict, _ = build_synthetic_spec(args.paths, 1)
+
+    def setup():
+        return (copy.deepcopy(path_dict),)
+
+    print('%-32s %10s' % ('operation ids', 'seconds'))
+    for name, function in (('list lookup (baseline)', legacy_create_unique_op_ids),
+                           ('set index', vmsgen.create_unique_op_ids)):
+        print('%-32s %10.3f' % (name, time_best_with_setup(setup, function, args.repeat)))
+
+
+SWAGGER_BUILTIN_TYPES = {'date_time': ('string', 'date-time'), 'secret': ('string', 'password'),
+                         'any_error': ('string', None), 'dynamic_structure': ('object', None),
+                         'uri': ('string', 'uri'), 'id': ('string', None), 'long': ('integer', 'int64'),
+                         'double': ('number', 'double'), 'binary': ('string', 'binary')}
+
+
+def table_metamodel_to_swagger_type_converter(input_type):
+    """
+    metamodel_to_swagger_type_converter as a dict lookup instead of its chain of comparisons.
+    Not faster: the lookup and the default tuple cost as much as the comparisons.
+    """
+    input_type = input_type.lower()
+    return SWAGGER_BUILTIN_TYPES.get(input_type, (input_type, None))
+
+
+def legacy_is_type_builtin(type_):
+    """
+    is_type_builtin before the BUILTIN_TYPE_NAMES constant: the set is built on every call.
+    """
+    type_ = type_.lower()
+    typeset = {'binary', 'boolean', 'datetime', 'double', 'dynamicstructure', 'exception',
+               'id', 'long', 'opaque', 'secret', 'string', 'uri'}
+    if type_ in typeset:
+        return True
+    return False
+
+
+def benchmark_converter(args):
+    """
+    Compares the comparison chain of the builtin type converter with a table lookup, and the set literal
+    is_type_builtin used to build on every call with the BUILTIN_TYPE_NAMES constant.
+    Both are called for every field of every structure.
+    """
+    builtin_types = ['BOOLEAN', 'LONG', 'DOUBLE', 'STRING', 'BINARY', 'SECRET', 'DATE_TIME', 'ID', 'URI',
+                     'ANY_ERROR', 'DYNAMIC_STRUCTURE', 'OPAQUE', 'VOID']
+    type_names = builtin_types + ['com.vmware.vcenter.mock%d.info' % index for index in range(len(builtin_types))]
+    builtin_types = (builtin_types * (args.calls // len(builtin_types) + 1))[:args.calls]
+    type_names = (type_names * (args.calls // len(type_names) + 1))[:args.calls]
+
+    def convert_all(converter):
+        def run():
+            for builtin in builtin_types:
+                converter(builtin)
+        return run
+
+    def check_all(is_type_builtin):
+        def run():
+            for type_name in type_names:
+                is_type_builtin(type_name)
+        return run
+
+    print('%-32s %10s %10s' % ('builtin types', 'seconds', 'us/call'))
+    for name, function in (('converter if chain', convert_all(vmsgen.metamodel_to_swagger_type_converter)),
+                           ('converter table', convert_all(table_metamodel_to_swagger_type_converter)),
+                           ('is_type_builtin set (baseline)', check_all(legacy_is_type_builtin)),
+                           ('is_type_builtin frozenset', check_all(vmsgen.is_type_builtin))):
+        seconds = time_best(function, args.repeat)
+        print('%-32s %10.3f %10.3f' % (name, seconds, seconds * 1e6 / args.calls))
+
+
+def benchmark_write(args):
+    """
+    Compares json.dump of sorted copies, as process_output used to do, with write_swagger_to_file.
+    """
+    path_dict, type_dict = build_synthetic_spec(args.paths, args.definitions)
+    template = {'swagger': '2.0', 'info': {'title': 'mock'}, 'paths': path_dict, 'definitions': type_dict}
+    output_dir = tempfile.mkdtemp()
+    file_name = os.path.join(output_dir, 'mock.json')
+
+    def baseline():
+        sorted_template = dict(template)
+        sorted_template['paths'] = collections.OrderedDict(sorted(path_dict.items()))
+        sorted_template['definitions'] = collections.OrderedDict(sorted(type_dict.items()))
+        vmsgen.write_json_data_to_file(file_name, sorted_template)
+
+    def streaming(compact, backend):
+        def write():
+            vmsgen.COMPACT_JSON = compact
+            vmsgen.JSON_BACKEND = backend
+            vmsgen.write_swagger_to_file(file_name, template)
+        return write
+
+    cases = [('json.dump indented (baseline)', baseline),
+             ('streaming json indented', streaming(False, 'json')),
+             ('streaming json compact', streaming(True, 'json'))]
+    if vmsgen.orjson is not None:
+        cases.append(('streaming orjson indented', streaming(False, 'orjson')))
+        cases.append(('streaming orjson compact', streaming(True, 'orjson')))
+    try:
+        print('%-32s %10s %10s %10s' % ('writer', 'seconds', 'MB', 'MB/s'))
+        for name, function in cases:
+            seconds = time_best(function, args.repeat)
+            size = os.path.getsize(file_name) / 1e6
+            print('%-32s %10.3f %10.2f %10.1f' % (name, seconds, size, size / seconds))
+    finally:
+        vmsgen.COMPACT_JSON = False
+        vmsgen.JSON_BACKEND = 'auto'
+        shutil.rmtree(output_dir)
+
+
+BENCHMARKS = collections.OrderedDict([('postprocess', benchmark_postprocess),
+                                      ('op_ids', benchmark_op_ids),
+                                      ('converter', benchmark_converter),
+                                      ('write', benchmark_write),
+                                      ('generate', benchmark_generate)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for vmsgen')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run, all if not specified. One of: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--paths', type=int, default=3000, help='Number of paths in synthetic specs')
+    parser.add_argument('--definitions', type=int, default=6000, help='Number of definitions in synthetic specs')
+    parser.add_argument('--calls', type=int, default=200000,
+                        help='Number of type conversions of the converter benchmark')
+    parser.add_argument('--services', type=int, default=100, help='Number of services in synthetic metamodels')
+    parser.add_argument('--operations', type=int, default=6, help='Number of operations per service')
+    parser.add_argument('--fields', type=int, default=8, help='Number of fields per structure')
+    parser.add_argument('--depth', type=int, default=2, help='Nesting depth of generic fields')
+    parser.add_argument('--recursion', type=int, default=2,
+                        help='Length of the cycle of structures referring to each other, 0 for no recursion')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 2, 4],
+                        help='Multiples of --services the generate benchmark runs with')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark ' + name)
+    for name in args.benchmarks or BENCHMARKS:
+        print('== ' + name)
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,14 @@
 import vmsgen
+import collections
+import copy
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import types
 import unittest
 from unittest import mock as mock
 
@@ -62,6 +72,13 @@ class TestVmsGen(unittest.TestCase):
             vmsgen.get_input_params()
         self.assertEqual(generate_op_id_expected, vmsgen.GENERATE_UNIQUE_OP_IDS)
 
+        # case 4: snapshots can't be limited to some packages or services
+        test_args = ['vmsgen', '-vc', 'v_url', '--save-snapshot', 'vc.snapshot', '--packages', 'vcenter']
+        with mock.patch('sys.argv', test_args):
+            self.assertRaises(ValueError, vmsgen.get_input_params)
+        vmsgen.PACKAGE_FILTERS = ()
+        vmsgen.SNAPSHOT_OUTPUT = None
+
     def test_post_process_path(self):
         '''
             Test cases to check if post process path which adds vmware-use-header-authn as a nessecary header params
@@ -224,7 +241,32 @@ class TestVmsGen(unittest.TestCase):
         self.assertEqual(actual, expected)
 
 
-    def test_cleanup(self):
+    def test_extract_path_parameters(self):
+
+        def mock_param(name, path_variable=None):
+            param = mock.Mock(metadata={})
+            param.name = name
+            if path_variable is not None:
+                param.metadata['PathVariable'] = mock.Mock(elements={'value': mock.Mock(string_value=path_variable)})
+            return param
+
+        pool = mock_param('resource_pool', 'resource-pool')
+        vm = mock_param('vm')
+        spec = mock_param('spec')
+        # case 1: placeholders are matched by name or PathVariable, the url takes the parameter names
+        path_params, other_params, new_url = vmsgen.extract_path_parameters(
+            [spec, vm, pool], '/vcenter/resource-pool/{resource-pool}/vm/{vm}')
+        self.assertEqual([pool, vm], path_params)
+        self.assertEqual([spec], other_params)
+        self.assertEqual('/vcenter/resource-pool/{resource_pool}/vm/{vm}', new_url)
+        self.assertEqual((('{resource-pool}', 'resource-pool'), ('{vm}', 'vm')),
+                         vmsgen.parse_url_template('/vcenter/resource-pool/{resource-pool}/vm/{vm}'))
+        # case 2: url without placeholders
+        self.assertEqual(([], [spec], '/vcenter/vm'), vmsgen.extract_path_parameters([spec], '/vcenter/vm'))
+
+    def test_post_process_spec(self):
+
+        vmsgen.GENERATE_UNIQUE_OP_IDS = False
 
         # case 1: [path dict] -> delete path and method mentioned inside path_dict value because key is the path and value of path_dict's key is method, hence remove the redundant data.
         path_dict = {
@@ -255,7 +297,7 @@ class TestVmsGen(unittest.TestCase):
 
         type_dict = {}
 
-        vmsgen.cleanup(path_dict, type_dict)
+        vmsgen.post_process_spec(path_dict, type_dict)
         self.assertEqual(path_dict, path_dict_expected)
 
         # case 2: [type dict] -> delete attribute named 'required' present in any property of any model's structure type 
@@ -281,7 +323,7 @@ class TestVmsGen(unittest.TestCase):
                 }
             }
         }
-        vmsgen.cleanup(path_dict, type_dict)
+        vmsgen.post_process_spec(path_dict, type_dict)
         self.assertEqual(type_dict, type_dict_expected)
 
     def test_remove_query_params(self):
@@ -434,116 +476,30 @@ class TestVmsGen(unittest.TestCase):
         vmsgen.remove_query_params(path_dict)
         self.assertEqual(path_dict, path_dict_expected)
 
-    def test_remove_com_vmware_from_dict(self):
-
-        # case 1 (path dict processing): removing com.vmware. from every key-value pair which contains it and $ from every ref value of definition
-        # case 1.1: remove com.vmware from value of when key is either of ('$ref', 'summary', 'description')
-        # case 1.2: removing $ sign from ref value's, example: { "$ref" : "#/definitions/vcenter.vcha.cluster.failover$task_result" }
-        # case 1.3: removing attr required when it is with '$ref'
-        
-        path_dict = {
-            'com/vmware/mock/path':{
-                'get': {
-                    'tags': ['mock'], 
-                    'summary': 'com.vmware.mock',  # 1.1:  example 1
-                    'parameters': [
-                        {
-                            "in" : "path",
-                            "description" : "com.vmware.somemockparam description" # # 1.1: example 2
-                        },
-                        {
-                            "$ref": '#/parameters/com.vmware.somemockparam' # 1.1 : example 3
-                        }
-                    ], 
-                    'responses': {
-                        'mock 200': {
-                            'description': 'description about com.vmware.mock_response',
-                            'schema': {
-                                '$ref': '#/definitions/com.vmware.mock_response$result', # 1.2
-                                'required': False # 1.3
-                            }
-                        }
-                    },
-                    'operationId': 'get'
-                }
-            }
-        }
-
-        path_dict_expected = {
-            'com/vmware/mock/path': {
-                'get': {
-                    'tags': ['mock'], 
-                    'summary': 'mock', 
-                    'parameters': [
-                        {
-                            'in': 'path', 
-                            'description': 'somemockparam description'
-                        }, 
-                        {
-                            '$ref': '#/parameters/somemockparam'
-                        }
-                    ],
-                    'responses': {
-                        'mock 200': {
-                            'description': 'description about mock_response', 
-                            'schema': {
-                                '$ref': '#/definitions/mock_response_result'
-                            }
-                        }
-                    },
-                    'operationId': 'get'
-                }
-            }
-        }
-
-        vmsgen.remove_com_vmware_from_dict(path_dict)   
-        self.assertEqual(path_dict, path_dict_expected)
-
-        # case 2 (type dict processing)
-        # case 2.1 : remove com.vmware and replace '$' from key's
-        # case 2.2 : removing attr required when it is with '$ref'
-        type_dict = { 
-            'com.vmware.mock.mock_check$list' : { # 2.1 : example 1
-                'type': 'object', 
-                'properties': {
-                    'value': {
-                        'description': ' value desc.', 
-                        'type': 'array', 
-                        'items': {
-                            '$ref': '#/definitions/com.vmware.mock_check_item', # 2.1 : example 2
-                            'required': True # 2.2
-                        }
-                    },
-                    'data': {
-                        'description': ' data desc ', 
-                        'type': 'object'
-                    },
-                    'required': ['value']
-                }
-            }
-        }
-        type_dict_expected = {
-            'mock.mock_check_list': {
-                'type': 'object', 
-                'properties': {
-                    'value': {
-                        'description': 
-                        ' value desc.', 
-                        'type': 'array', 
-                        'items': {
-                            '$ref': '#/definitions/mock_check_item'
-                        }
-                    }, 
-                    'data': {
-                        'description': ' data desc ', 
-                        'type': 'object'
-                    }, 
-                    'required': ['value']
-                }
-            }
-        }
-        vmsgen.remove_com_vmware_from_dict(type_dict)
-        self.assertEqual(type_dict, type_dict_expected)
+    def test_remove_query_params_report(self):
+
+        def mock_path_dict(paths):
+            return collections.OrderedDict((path, {method: {'parameters': []}}) for path, method in paths)
+
+        paths = [('mock/{id}?action=a', 'post'), ('mock/{id}?action=b', 'post'), ('mock/{id}', 'get'),
+                 ('mock/{name}/child', 'get'), ('mock/{other}/child', 'get')]
+        # case 1: the result doesn't depend on the order of the paths
+        path_dict = mock_path_dict(paths)
+        report = vmsgen.remove_query_params(path_dict)
+        reversed_path_dict = mock_path_dict(reversed(paths))
+        self.assertEqual(report, vmsgen.remove_query_params(reversed_path_dict))
+        self.assertEqual(dict(path_dict), dict(reversed_path_dict))
+        self.assertEqual(['action=a'], [param['description'] for param in path_dict['mock/{id}']['post']['parameters']])
+        # case 2: absolute duplicates and paths which only differ in their path variables are reported
+        self.assertEqual(['mock/{id}?action=b'], report['duplicates'])
+        self.assertEqual([['mock/{name}/child', 'mock/{other}/child']], report['conflicts'])
+
+    def test_get_model_name(self):
+        self.assertEqual('vcenter.VM.info', vmsgen.get_model_name('com.vmware.vcenter.VM.info'))
+        self.assertEqual('vcenter.vm_info', vmsgen.get_model_name('com.vmware.vcenter.vm$info'))
+        self.assertEqual('list of vcenter.VM.summary',
+                         vmsgen.get_model_description('list of com.vmware.vcenter.VM.summary'))
+        self.assertIsNone(vmsgen.get_model_description(None))
 
     def test_create_camelized_op_id(self):
 
@@ -579,6 +535,62 @@ class TestVmsGen(unittest.TestCase):
 
         # Note: create_unique_op_ids(path_dict) test cases are handled in test cases provided for create_camelized_op_id
 
+    def test_create_unique_op_ids(self):
+
+        def mock_path_dict():
+            return {
+                'com/vmware/mock/{id}': {'get': {'operationId': 'get'}, 'delete': {'operationId': 'delete'}},
+                'com/vmware/mock': {'get': {'operationId': 'get'}},
+                'com/vmware/mock?~action=get': {'post': {'operationId': 'get'}}
+            }
+
+        # case 1: colliding ids get a numeric suffix, in sorted path order
+        path_dict = mock_path_dict()
+        op_id_index = vmsgen.create_unique_op_ids(path_dict)
+        self.assertEqual('getMock', path_dict['com/vmware/mock']['get']['operationId'])
+        self.assertEqual('getMock2', path_dict['com/vmware/mock/{id}']['get']['operationId'])
+        self.assertEqual('getMock3', path_dict['com/vmware/mock?~action=get']['post']['operationId'])
+        self.assertEqual('deleteMock', path_dict['com/vmware/mock/{id}']['delete']['operationId'])
+        self.assertEqual(['getMock2', 'getMock3'], [collision['operationId'] for collision in op_id_index.collisions])
+
+        # case 2: a shared index keeps ids unique across packages
+        op_id_index = vmsgen.OperationIdIndex(['a', 'b'])
+        with op_id_index.turn('a'):
+            vmsgen.create_unique_op_ids(mock_path_dict(), op_id_index, 'a')
+        other_path_dict = mock_path_dict()
+        with op_id_index.turn('b'):
+            vmsgen.create_unique_op_ids(other_path_dict, op_id_index, 'b')
+        self.assertEqual('getMock4', other_path_dict['com/vmware/mock']['get']['operationId'])
+        self.assertEqual('deleteMock2', other_path_dict['com/vmware/mock/{id}']['delete']['operationId'])
+        self.assertEqual([], op_id_index.pending_packages)
+
+    def test_process_service_urls_profiled_turns(self):
+        def generate_package(package_name, *args):
+            with vmsgen.OP_ID_INDEX.turn(package_name):
+                order.append(package_name)
+        order = []
+        profile_dir = tempfile.mkdtemp()
+        vmsgen.OP_ID_INDEX = vmsgen.OperationIdIndex(['a', 'b'])
+        vmsgen.PROFILE_DIR = profile_dir
+        try:
+            with mock.patch('vmsgen.generate_package', side_effect=generate_package):
+                # the package sorted last starts first, it must not hold the profiler while waiting for its turn
+                threads = [threading.Thread(target=vmsgen.process_service_urls,
+                                            args=(package_name, [], None, {}, {}, {}, {}, {}, None), daemon=True)
+                           for package_name in ('b', 'a')]
+                for thread in threads:
+                    thread.start()
+                    time.sleep(0.05)
+                for thread in threads:
+                    thread.join(5)
+                    self.assertFalse(thread.is_alive())
+            self.assertEqual(['a', 'b'], order)
+            self.assertEqual(['a.pstats', 'b.pstats'], sorted(os.listdir(profile_dir)))
+        finally:
+            vmsgen.OP_ID_INDEX = None
+            vmsgen.PROFILE_DIR = None
+            shutil.rmtree(profile_dir)
+
     def test_categorize_service_urls_by_package_names(self):
 
         # A simple mock example to show case the result
@@ -640,5 +652,599 @@ class TestVmsGen(unittest.TestCase):
         ret_actual = vmsgen.find_url(list_of_links)
         self.assertEqual(ret_actual, ret_expected)
         
+    def test_snapshot_round_trip(self):
+
+        # every section is restored and values are only unpickled on lookup
+        enumeration_dict = {'com.vmware.mock.enum': ['A', 'B']}
+        structure_dict = {'com.vmware.mock.struct': {'fields': ['f1']}}
+        service_dict = {'com.vmware.mock.service': {'operations': {}}}
+        service_urls_map = {'https://vcip/rest/com/vmware/mock/service': 'com.vmware.mock.service'}
+        service_operations_dict = {'https://vcip/rest/com/vmware/mock/service': [{'name': 'get'}]}
+        snapshot_dir = tempfile.mkdtemp()
+        file_name = os.path.join(snapshot_dir, 'snapshot.bin')
+        vmsgen.save_snapshot(file_name, 'https://vcip/api', 'https://vcip/rest', enumeration_dict, structure_dict,
+                             service_dict, service_urls_map, service_operations_dict)
+        actual = vmsgen.load_snapshot(file_name)
+        self.assertEqual(('https://vcip/api', 'https://vcip/rest'), actual[:2])
+        self.assertEqual(0, len(actual[3]._values))
+        self.assertEqual([enumeration_dict, structure_dict, service_dict, service_urls_map, service_operations_dict],
+                         [dict(section) for section in actual[2:]])
+        self.assertIsNone(actual[3].get('com.vmware.missing'))
+
+        # snapshot sections are pickled for --processes workers without their unpickled values
+        structures = pickle.loads(pickle.dumps(actual[3]))
+        self.assertEqual(structure_dict, dict(structures))
+        self.assertNotIn('_values', actual[3].__getstate__())
+        os.remove(file_name)
+        os.rmdir(snapshot_dir)
+
+    def test_get_json(self):
+
+        # case 1: response is parsed once and the 'value' wrapper is removed
+        response = mock.Mock(ok=True)
+        response.json.return_value = {'value': ['mock']}
+        session = mock.Mock()
+        session.get.return_value = response
+        with mock.patch('vmsgen.get_http_session', return_value=session):
+            actual = vmsgen.get_json('https://vcip/rest/mock', False)
+        self.assertEqual(['mock'], actual)
+        self.assertEqual(1, response.json.call_count)
+        session.get.assert_called_once_with('https://vcip/rest/mock', verify=False)
+
+        # case 2: failed requests return None
+        response = mock.Mock(ok=False, content='mock error')
+        session.get.return_value = response
+        with mock.patch('vmsgen.get_http_session', return_value=session):
+            actual = vmsgen.get_json('https://vcip/rest/mock')
+        self.assertIsNone(actual)
+
+        # case 3: a single session is shared
+        self.assertIs(vmsgen.get_http_session(), vmsgen.get_http_session())
+
+        # case 4: with a cache, documents are revalidated with their validators
+        vmsgen.HTTP_CACHE_DIR = tempfile.mkdtemp()
+        try:
+            response = mock.Mock(ok=True, status_code=200, headers={'ETag': '"1"'})
+            response.json.return_value = {'value': ['mock']}
+            session.get.return_value = response
+            with mock.patch('vmsgen.get_http_session', return_value=session):
+                vmsgen.get_json('https://vcip/rest/mock')
+                session.get.return_value = mock.Mock(ok=False, status_code=304)
+                actual = vmsgen.get_json('https://vcip/rest/mock')
+            self.assertEqual(['mock'], actual)
+            session.get.assert_called_with('https://vcip/rest/mock', verify=True, headers={'If-None-Match': '"1"'})
+        finally:
+            vmsgen.HTTP_CACHE_DIR = None
+
+    def test_prefetch_service_operations(self):
+
+        # only known services without RequestMapping annotations are fetched
+        annotated = mock.Mock(metadata={'RequestMapping': 'mock'})
+        not_annotated = mock.Mock(metadata={})
+        service_dict = {
+            'com.vmware.mock.annotated': mock.Mock(operations={'get': annotated}),
+            'com.vmware.mock.options': mock.Mock(operations={'get': annotated, 'list': not_annotated})
+        }
+        service_url_dict = {
+            'https://vcip/rest/com/vmware/mock/annotated': 'com.vmware.mock.annotated',
+            'https://vcip/rest/com/vmware/mock/options': 'com.vmware.mock.options',
+            'https://vcip/rest/com/vmware/mock/unknown': 'com.vmware.mock.unknown'
+        }
+        with mock.patch('vmsgen.get_json', return_value=[{'name': 'list'}]) as get_json:
+            actual = vmsgen.prefetch_service_operations(service_url_dict, service_dict, service_url_dict)
+        self.assertEqual({'https://vcip/rest/com/vmware/mock/options': [{'name': 'list'}]}, actual)
+        get_json.assert_called_once_with('https://vcip/rest/com/vmware/mock/options?~method=OPTIONS', False)
+
+    def test_populate_dicts(self):
+
+        # every downloaded component is merged into the dictionaries
+        def mock_component(name):
+            structure = mock.Mock(enumerations={'com.vmware.%s.struct.enum' % name: 'struct enum'})
+            service = mock.Mock(structures={}, enumerations={'com.vmware.%s.service.enum' % name: 'service enum'})
+            package = mock.Mock(enumerations={'com.vmware.%s.enum' % name: 'enum'},
+                                structures={'com.vmware.%s.struct' % name: structure},
+                                services={'com.vmware.%s.service' % name: service})
+            return mock.Mock(info=mock.Mock(packages={'com.vmware.' + name: package}))
+
+        component_svc = mock.Mock()
+        component_svc.list.return_value = ['com.vmware.mock1', 'com.vmware.mock2']
+        component_svc.get.side_effect = lambda component: mock_component(component.split('.')[-1])
+        enumeration_dict, structure_dict, service_dict, service_urls_map = {}, {}, {}, {}
+        vmsgen.populate_dicts(component_svc, enumeration_dict, structure_dict, service_dict, service_urls_map,
+                              'https://vcip/rest')
+        self.assertEqual(6, len(enumeration_dict))
+        self.assertEqual(['com.vmware.mock1.struct', 'com.vmware.mock2.struct'], sorted(structure_dict))
+        self.assertEqual(['com.vmware.mock1.service', 'com.vmware.mock2.service'], sorted(service_dict))
+        self.assertEqual('com.vmware.mock2.service', service_urls_map['https://vcip/rest/com/vmware/mock2/service'])
+
+        # a structure defined by several components is taken from the last one listed, whichever completes first
+        def slow_first_component(component):
+            if component == 'com.vmware.mock1':
+                time.sleep(0.1)
+            package = mock.Mock(enumerations={}, services={},
+                                structures={'com.vmware.shared.struct': mock.Mock(enumerations={}, component=component)})
+            return mock.Mock(info=mock.Mock(packages={component: package}))
+        component_svc.get.side_effect = slow_first_component
+        structure_dict = {}
+        vmsgen.populate_dicts(component_svc, {}, structure_dict, {}, {}, 'https://vcip/rest')
+        self.assertEqual('com.vmware.mock2', structure_dict['com.vmware.shared.struct'].component)
+
+    def test_service_filters(self):
+        vmsgen.PACKAGE_FILTERS = ('vc*',)
+        vmsgen.SERVICE_FILTERS = ('*.vm', '*.cluster')
+        try:
+            self.assertTrue(vmsgen.is_service_selected('com.vmware.vcenter.vm'))
+            self.assertFalse(vmsgen.is_service_selected('com.vmware.vcenter.host'))
+            self.assertFalse(vmsgen.is_service_selected('com.vmware.esx.cluster'))
+            self.assertTrue(vmsgen.is_component_selected('com.vmware.vcenter'))
+            self.assertFalse(vmsgen.is_component_selected('com.vmware.cis'))
+            self.assertEqual({'https://vcip/rest/com/vmware/vcenter/vm': 'com.vmware.vcenter.vm'},
+                             vmsgen.select_service_urls({
+                                 'https://vcip/rest/com/vmware/vcenter/vm': 'com.vmware.vcenter.vm',
+                                 'https://vcip/rest/com/vmware/cis/session': 'com.vmware.cis.session'}))
+
+            # packages of previous runs are kept in api.json
+            output_dir = tempfile.mkdtemp()
+            vmsgen.write_json_data_to_file(os.path.join(output_dir, 'api.json'), {'files': ['cis', 'vcenter']})
+            vmsgen.write_api_file(output_dir, ['vcenter', 'vcha'])
+            with open(os.path.join(output_dir, 'api.json')) as api_file:
+                self.assertEqual({'files': ['cis', 'vcenter', 'vcha']}, json.load(api_file))
+        finally:
+            vmsgen.PACKAGE_FILTERS = ()
+            vmsgen.SERVICE_FILTERS = ()
+        self.assertTrue(vmsgen.is_service_selected('com.vmware.cis.session'))
+
+    def test_lazy_metamodel(self):
+
+        def mock_component(name):
+            package = mock.Mock(enumerations={}, structures={'com.vmware.%s.struct' % name: mock.Mock(enumerations={})},
+                                services={})
+            return mock.Mock(info=mock.Mock(packages={'com.vmware.' + name: package}))
+
+        component_svc = mock.Mock()
+        component_svc.get.side_effect = lambda component: mock_component(component.split('.')[-1])
+        metamodel = vmsgen.LazyMetamodel(component_svc, ['com.vmware.mock1', 'com.vmware.mock2'], 'https://vcip/rest')
+        # case 1: only the component whose id is a prefix of the structure is downloaded
+        self.assertIsNotNone(metamodel.structure_dict.get('com.vmware.mock2.struct'))
+        component_svc.get.assert_called_once_with('com.vmware.mock2')
+        # case 2: unknown names load the remaining components, which is reported
+        with mock.patch('vmsgen.eprint') as eprint:
+            self.assertIsNone(metamodel.structure_dict.get('com.vmware.unknown.struct'))
+        eprint.assert_called_once_with('com.vmware.unknown.struct is not in the components matching it,'
+                                       ' loading all 1 remaining components')
+        self.assertEqual(2, component_svc.get.call_count)
+        self.assertEqual(['com.vmware.mock1.struct', 'com.vmware.mock2.struct'], sorted(metamodel.structure_dict))
+        # case 3: a component which can't be merged fails its lookups, later ones don't wait for it
+        metamodel = vmsgen.LazyMetamodel(component_svc, ['com.vmware.mock1'], 'https://vcip/rest')
+        with mock.patch('vmsgen.merge_component_data', side_effect=ValueError('bad component')):
+            self.assertRaises(ValueError, metamodel.load, 'com.vmware.mock1')
+        self.assertRaises(ValueError, metamodel.load, 'com.vmware.mock1')
+        self.assertEqual(set(), metamodel.pending)
+
+    def test_iter_service_urls_from_rest_navigation(self):
+
+        # services of all components are discovered, duplicates are yielded once
+        responses = {
+            'https://vcip/rest': {'components': {'href': 'https://vcip/rest/components'}},
+            'https://vcip/rest/components': [{'services': {'href': 'https://vcip/rest/mock1'}},
+                                             {'services': {'href': 'https://vcip/rest/mock2'}}],
+            'https://vcip/rest/mock1': [{'href': 'https://vcip/rest/com/vmware/mock1/a', 'name': 'com.vmware.mock1.a'}],
+            'https://vcip/rest/mock2': [{'href': 'https://vcip/rest/com/vmware/mock2/b', 'name': 'com.vmware.mock2.b'},
+                                        {'href': 'https://vcip/rest/com/vmware/mock1/a', 'name': 'com.vmware.mock1.a'}]
+        }
+        service_urls_map = {}
+        with mock.patch('vmsgen.get_json', side_effect=lambda url, verify: responses[url]):
+            service_urls = list(vmsgen.collect_service_urls(
+                vmsgen.iter_service_urls_from_rest_navigation('https://vcip/rest'), service_urls_map))
+        self.assertEqual(['https://vcip/rest/com/vmware/mock1/a', 'https://vcip/rest/com/vmware/mock2/b'],
+                         sorted(service_urls))
+        self.assertEqual({'https://vcip/rest/com/vmware/mock1/a': 'com.vmware.mock1.a',
+                          'https://vcip/rest/com/vmware/mock2/b': 'com.vmware.mock2.b'}, service_urls_map)
+
+        # a component whose services list can't be read is skipped
+        failed_responses = dict(responses)
+        failed_responses['https://vcip/rest/mock2'] = None
+        with mock.patch('vmsgen.get_json', side_effect=lambda url, verify: failed_responses[url]):
+            self.assertEqual([('https://vcip/rest/com/vmware/mock1/a', 'com.vmware.mock1.a')],
+                             list(vmsgen.iter_service_urls_from_rest_navigation('https://vcip/rest')))
+
+        # failures to read the rest navigation root or components are raised to the consumer
+        for failed_url in ('https://vcip/rest', 'https://vcip/rest/components'):
+            failed_responses = dict(responses)
+            failed_responses[failed_url] = None
+            with mock.patch('vmsgen.get_json', side_effect=lambda url, verify: failed_responses[url]):
+                with self.assertRaisesRegex(ValueError, 'Cannot read rest navigation.* at ' + failed_url + '$'):
+                    list(vmsgen.iter_service_urls_from_rest_navigation('https://vcip/rest'))
+
+    def test_check_type_schema_cache(self):
+
+        # structure mock.a has a field of structure mock.b
+        def mock_field(name, resource_id):
+            user_defined_type = mock.Mock(resource_type='com.vmware.vapi.structure', resource_id=resource_id)
+            return mock.Mock(documentation=name + ' doc', type=mock.Mock(category='USER_DEFINED',
+                                                                         user_defined_type=user_defined_type))
+        field_a = mock_field('b', 'com.vmware.mock.b')
+        field_a.name = 'b'
+        structure_dict = {'com.vmware.mock.a': mock.Mock(fields=[field_a]),
+                          'com.vmware.mock.b': mock.Mock(fields=[])}
+        structure_svc = mock.Mock()
+        structure_svc.get.side_effect = structure_dict.get
+        vmsgen.SCHEMA_CACHE = vmsgen.SchemaCache()
+
+        # case 1: first package converts both structures
+        type_dict = {}
+        vmsgen.check_type('com.vmware.vapi.structure', 'com.vmware.mock.a', type_dict, structure_svc, None)
+        self.assertEqual(['mock.a', 'mock.b'], sorted(type_dict))
+        self.assertEqual(2, structure_svc.get.call_count)
+
+        # case 2: second package takes the structure and its dependency from the cache
+        other_type_dict = {}
+        vmsgen.check_type('com.vmware.vapi.structure', 'com.vmware.mock.a', other_type_dict, structure_svc, None)
+        self.assertEqual(type_dict, other_type_dict)
+        self.assertIsNot(type_dict['mock.a'], other_type_dict['mock.a'])
+        self.assertEqual(2, structure_svc.get.call_count)
+        self.assertEqual({'hits': 2, 'misses': 2, 'entries': 2}, vmsgen.SCHEMA_CACHE.stats())
+        self.assertIn('com.vmware.mock.b', vmsgen.SCHEMA_CACHE)
+        self.assertNotIn('com.vmware.mock.c', vmsgen.SCHEMA_CACHE)
+
+    def test_visitor_stats(self):
+        field = mock.Mock(documentation='name doc', type=mock.Mock(category='BUILTIN', builtin_type='STRING'))
+        field.name = 'name'
+        structure_svc = mock.Mock()
+        structure_svc.get.return_value = mock.Mock(fields=[field])
+        vmsgen.SCHEMA_CACHE = vmsgen.SchemaCache()
+        check_type = vmsgen.check_type
+        visitor_stats = vmsgen.VisitorStats()
+        visitor_stats.install()
+        try:
+            type_dict = {}
+            vmsgen.check_type('com.vmware.vapi.structure', 'com.vmware.mock.a', type_dict, structure_svc, None)
+            vmsgen.check_type('com.vmware.vapi.structure', 'com.vmware.mock.a', type_dict, structure_svc, None)
+            vmsgen.check_type('com.vmware.vapi.structure', 'string', type_dict, structure_svc, None)
+        finally:
+            visitor_stats.uninstall()
+        # uninstall restores the original functions
+        self.assertIs(check_type, vmsgen.check_type)
+        report = visitor_stats.report()
+        self.assertEqual({'converted': 1, 'already_converted': 1, 'builtin': 1}, report['check_type'])
+        self.assertEqual(0.5, report['check_type_hit_ratio'])
+        self.assertEqual({'check_type': 3, 'process_structure_info': 1, 'visit_builtin': 1}, report['calls'])
+        self.assertEqual(3, report['max_depth'])
+        self.assertEqual(['mock.a'], list(report['types']))
+        self.assertEqual(1, report['types']['mock.a']['conversions'])
+
+    def test_fetch_component(self):
+
+        component_svc = mock.Mock()
+        component_svc.fingerprint.return_value = 'fingerprint-1'
+        component_svc.get.return_value = 'component data 1'
+        cache_dir = tempfile.mkdtemp()
+        vmsgen.METAMODEL_CACHE_DIR = cache_dir
+        try:
+            # case 1: component is not cached yet
+            self.assertEqual('component data 1', vmsgen.fetch_component(component_svc, 'com.vmware.mock'))
+            # case 2: fingerprint is unchanged, cached copy is used
+            component_svc.get.return_value = 'component data 2'
+            self.assertEqual('component data 1', vmsgen.fetch_component(component_svc, 'com.vmware.mock'))
+            self.assertEqual(1, component_svc.get.call_count)
+            # case 3: fingerprint changed, component is downloaded again
+            component_svc.fingerprint.return_value = 'fingerprint-2'
+            self.assertEqual('component data 2', vmsgen.fetch_component(component_svc, 'com.vmware.mock'))
+            self.assertEqual(2, component_svc.get.call_count)
+            # case 4: cache file of another version, without the fingerprint, is downloaded again
+            vmsgen.write_cache_file(os.path.join(cache_dir, 'com.vmware.mock.pickle'), {'data': 'component data 2'})
+            with mock.patch('vmsgen.eprint'):
+                self.assertEqual('component data 2', vmsgen.fetch_component(component_svc, 'com.vmware.mock'))
+            self.assertEqual(3, component_svc.get.call_count)
+        finally:
+            vmsgen.METAMODEL_CACHE_DIR = None
+            os.remove(os.path.join(cache_dir, 'com.vmware.mock.pickle'))
+            os.rmdir(cache_dir)
+
+    def test_collect_referenced_definitions(self):
+
+        # definitions are collected transitively, unreferenced and unknown ones are left out
+        path = {'responses': {200: {'schema': {'$ref': '#/definitions/mock.a'}}},
+                'parameters': [{'schema': {'$ref': '#/definitions/mock.unknown'}}]}
+        type_dict = {
+            'mock.a': {'properties': {'b': {'type': 'array', 'items': {'$ref': '#/definitions/mock.b'}}}},
+            'mock.b': {'properties': {'a': {'$ref': '#/definitions/mock.a'}}},
+            'mock.c': {'type': 'string'}
+        }
+        actual = vmsgen.collect_referenced_definitions(path, type_dict)
+        self.assertEqual({'mock.a': type_dict['mock.a'], 'mock.b': type_dict['mock.b']}, actual)
+
+    def test_get_path_operation_cache(self):
+
+        def generic(generic_type, element_type):
+            return types.SimpleNamespace(category='GENERIC', generic_instantiation=types.SimpleNamespace(
+                generic_type=generic_type, element_type=element_type, map_key_type=None, map_value_type=None))
+
+        def field(name, type_):
+            return types.SimpleNamespace(name=name, documentation=name + ' doc', type=type_, metadata={})
+
+        def operation(params, output_type):
+            not_found = types.SimpleNamespace(structure_id='com.vmware.mock.not_found', documentation='missing')
+            return types.SimpleNamespace(documentation='operation doc', params=params, errors=[not_found],
+                                         output=types.SimpleNamespace(documentation='output doc', type=output_type))
+
+        state = types.SimpleNamespace(category='USER_DEFINED', user_defined_type=types.SimpleNamespace(
+            resource_type='com.vmware.vapi.enumeration', resource_id='com.vmware.mock.state'))
+        filter_spec = types.SimpleNamespace(category='USER_DEFINED', user_defined_type=types.SimpleNamespace(
+            resource_type='com.vmware.vapi.structure', resource_id='com.vmware.mock.filter_spec'))
+        structure_dict = {'com.vmware.mock.filter_spec': types.SimpleNamespace(
+                              fields=[field('states', generic('OPTIONAL', generic('SET', state)))]),
+                          'com.vmware.mock.not_found': types.SimpleNamespace(fields=[])}
+        enum_dict = {'com.vmware.mock.state': types.SimpleNamespace(
+            documentation='state doc', values=[types.SimpleNamespace(value='ON')])}
+        # the first operation returns the enumeration, the second one flattens it into a query parameter
+        operations = [(operation([], state), '/mock/state', 'get'),
+                      (operation([field('filter', generic('OPTIONAL', filter_spec))],
+                                 types.SimpleNamespace(category='BUILTIN', builtin_type='STRING')), '/mock', 'list')]
+
+        def generate(registered_components=()):
+            vmsgen.SCHEMA_CACHE = vmsgen.SchemaCache()
+            vmsgen.COMPONENT_REGISTRY = vmsgen.ComponentRegistry()
+            for component in registered_components:
+                vmsgen.COMPONENT_REGISTRY.intern('responses', component)
+            type_dict = {}
+            path_dict = vmsgen.convert_path_list_to_path_map([
+                vmsgen.get_path(operation_info, 'GET', url, 'com.vmware.mock', type_dict, structure_dict,
+                                enum_dict, operation_id, {}) for operation_info, url, operation_id in operations])
+            components = vmsgen.reuse_components(path_dict) if vmsgen.REUSE_COMPONENTS else None
+            return path_dict, type_dict, components
+
+        cache_dir = tempfile.mkdtemp()
+        vmsgen.OPERATION_CACHE_DIR = cache_dir
+        try:
+            # case 1: a warm run gives the same output as a cold one, the flattened parameter doesn't modify
+            # the definition
+            cold = copy.deepcopy(generate())
+            with mock.patch.object(vmsgen, 'build_operation_path') as build_operation_path:
+                warm = generate()
+            self.assertFalse(build_operation_path.called)
+            self.assertEqual(cold, warm)
+            self.assertEqual('state doc', warm[1]['mock.state']['description'])
+            self.assertEqual({'type': 'string', 'enum': ['ON']}, warm[0]['/mock']['get']['parameters'][0]['items'])
+            # case 2: with reused components, the $refs of cached operations are registered again
+            vmsgen.REUSE_COMPONENTS = True
+            cold = copy.deepcopy(generate())
+            with mock.patch.object(vmsgen, 'build_operation_path') as build_operation_path:
+                warm = generate([{'description': 'other'}])
+            self.assertFalse(build_operation_path.called)
+            self.assertEqual(cold, warm)
+            self.assertEqual(({}, {'mock.not_found_error': {
+                'description': 'missing', 'schema': {'$ref': '#/definitions/mock.not_found_error'}}}), warm[2])
+        finally:
+            vmsgen.OPERATION_CACHE_DIR = None
+            vmsgen.REUSE_COMPONENTS = False
+            shutil.rmtree(cache_dir)
+
+    def test_get_metamodel_digest(self):
+
+        # digest depends on content only, not on dict order or private attributes
+        class MockInfo(object):
+            def __init__(self, name, metadata):
+                self.name = name
+                self.metadata = metadata
+                self._private = object()
+
+        digest = vmsgen.get_metamodel_digest(MockInfo('mock', {'a': 1, 'b': [1, 2]}))
+        self.assertEqual(digest, vmsgen.get_metamodel_digest(MockInfo('mock', {'b': [1, 2], 'a': 1})))
+        self.assertNotEqual(digest, vmsgen.get_metamodel_digest(MockInfo('mock', {'a': 1, 'b': [2, 1]})))
+
+    def test_stats_recorder(self):
+        stats = vmsgen.StatsRecorder()
+        with stats.phase('discovery'):
+            stats.count('http_requests')
+        vmsgen.STATS_STATE.package = 'mock'
+        try:
+            with stats.phase('conversion', 'mock'):
+                stats.count('operations', 3)
+        finally:
+            vmsgen.STATS_STATE.package = None
+        stats.add_package('other', {'phases': {}, 'counters': collections.Counter(operations=2)})
+        report = stats.report()
+        self.assertEqual(['discovery'], list(report['phases']))
+        self.assertEqual({'http_requests': 1, 'operations': 5}, report['counters'])
+        self.assertEqual(3, report['packages']['mock']['counters']['operations'])
+        self.assertIn('operations_per_second', report['packages']['mock']['counters'])
+        self.assertEqual(['conversion'], list(report['packages']['mock']['phases']))
+        # the report is serializable
+        json.dumps(report)
+
+    def test_share_definitions(self):
+        error = {'type': 'object', 'properties': {'messages': {'type': 'array', 'items': {'type': 'string'}}}}
+        error_wrapper = {'type': 'object', 'properties': {'value': {'$ref': '#/definitions/std.error'}}}
+        documents = {
+            'a': {'paths': {'/a': {'get': {'responses': {404: {'schema': {'$ref': '#/definitions/std.error_error'}}}}}},
+                  'definitions': {'std.error': dict(error), 'std.error_error': dict(error_wrapper),
+                                  'a.result': {'type': 'string'}, 'a.other_result': {'type': 'string'},
+                                  'a.info': {'$ref': '#/definitions/a.other_result'}}},
+            'b': {'paths': {}, 'definitions': {'std.error': dict(error), 'std.error_error': dict(error_wrapper),
+                                               # same name, different content: stays in the packages
+                                               'a.result': {'type': 'integer'}}}}
+        shared_definitions, report = vmsgen.share_definitions(documents)
+        # case 1: definitions used by both packages are shared, along with the definitions they refer to
+        self.assertEqual(['std.error', 'std.error_error'], sorted(shared_definitions))
+        self.assertEqual('#/definitions/std.error', shared_definitions['std.error_error']['properties']['value']['$ref'])
+        self.assertEqual('common.json#/definitions/std.error_error',
+                         documents['a']['paths']['/a']['get']['responses'][404]['schema']['$ref'])
+        # case 2: structurally identical definitions are merged, the others refer to the first one by name
+        self.assertEqual(['a.info', 'a.other_result', 'a.result'], sorted(documents['a']['definitions']))
+        self.assertEqual({'$ref': '#/definitions/a.other_result'}, documents['a']['definitions']['a.result'])
+        self.assertEqual('#/definitions/a.other_result', documents['a']['definitions']['a.info']['$ref'])
+        self.assertEqual(['a.result'], list(documents['b']['definitions']))
+        self.assertEqual({'shared_definitions': 2, 'merged_definitions': 1}, report)
+        # case 3: a definition of a previous shared file which has another content isn't shared
+        documents = {package_name: {'paths': {}, 'definitions': {'std.error': dict(error)}} for package_name in 'ab'}
+        shared_definitions, _ = vmsgen.share_definitions(documents, {'std.error': {'type': 'string'}})
+        self.assertEqual({}, shared_definitions)
+        self.assertEqual(['std.error'], list(documents['a']['definitions']))
+
+    def test_merge_existing_output(self):
+        output_dir = tempfile.mkdtemp()
+        file_name = os.path.join(output_dir, 'mock.json')
+        try:
+            # case 1: no previous swagger file
+            path_dict = {'/a': {'get': {'operationId': 'new'}}}
+            vmsgen.merge_existing_output(file_name, path_dict, {})
+            self.assertEqual({'/a': {'get': {'operationId': 'new'}}}, path_dict)
+
+            # case 2: operations and definitions of the previous file are added, the new ones take precedence
+            vmsgen.write_json_data_to_file(file_name, {
+                'paths': {'/a': {'get': {'operationId': 'old'}, 'delete': {'operationId': 'old', 'parameters': [
+                    {'$ref': '#/parameters/id'}]}}, '/b': {'get': {'operationId': 'old'}}},
+                'parameters': {'id': {'in': 'path', 'name': 'id'}},
+                'definitions': {'a.info': {'type': 'string'}, 'b.info': {'type': 'string'}}})
+            type_dict = {'a.info': {'type': 'object'}}
+            vmsgen.merge_existing_output(file_name, path_dict, type_dict)
+            self.assertEqual({'/a': {'get': {'operationId': 'new'}, 'delete': {'operationId': 'old', 'parameters': [
+                {'in': 'path', 'name': 'id'}]}}, '/b': {'get': {'operationId': 'old'}}}, path_dict)
+            self.assertEqual({'a.info': {'type': 'object'}, 'b.info': {'type': 'string'}}, type_dict)
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_write_shared_output_filtered(self):
+        output_dir = tempfile.mkdtemp()
+        vmsgen.PACKAGE_FILTERS = ('a',)
+        try:
+            vmsgen.write_json_data_to_file(os.path.join(output_dir, 'common.json'), {'definitions': {
+                'std.error': {'type': 'object'}, 'b.spec': {'$ref': '#/definitions/std.error'}}})
+            vmsgen.write_json_data_to_file(os.path.join(output_dir, 'a.json'), {
+                'paths': {'/a': {'get': {'responses': {'200': {'schema': {
+                    '$ref': 'common.json#/definitions/b.spec'}}}}}},
+                'definitions': {}})
+            # case 1: shared definitions which a merged package refers to are copied into the package
+            path_dict = {}
+            type_dict = {}
+            vmsgen.merge_existing_output(os.path.join(output_dir, 'a.json'), path_dict, type_dict)
+            self.assertEqual('#/definitions/b.spec', path_dict['/a']['get']['responses']['200']['schema']['$ref'])
+            self.assertEqual({'std.error': {'type': 'object'}, 'b.spec': {'$ref': '#/definitions/std.error'}},
+                             type_dict)
+            # case 2: the definitions of the previous shared file are kept for the packages not generated
+            vmsgen.SHARED_DOCUMENTS = {'a': {'paths': {}, 'definitions': {}}}
+            vmsgen.write_shared_output(output_dir)
+            with open(os.path.join(output_dir, 'common.json')) as infile:
+                self.assertEqual(['b.spec', 'std.error'], sorted(json.load(infile)['definitions']))
+        finally:
+            vmsgen.PACKAGE_FILTERS = ()
+            vmsgen.SHARED_DOCUMENTS = {}
+            shutil.rmtree(output_dir)
+
+    def test_reuse_components(self):
+        def vm_param():
+            return {'in': 'path', 'name': 'vm', 'type': 'string', 'required': True, 'description': 'vm id'}
+
+        def not_found(description):
+            return {'description': description, 'schema': {'$ref': '#/definitions/std.not_found_error'}}
+        path_dict = {
+            '/vm/{vm}': {'get': {'parameters': [vm_param()],
+                                 'responses': {200: {'description': 'ok'}, 404: not_found('missing')}},
+                         'delete': {'parameters': [vm_param(), {'in': 'query', 'name': 'force', 'type': 'boolean'}],
+                                    'responses': {404: not_found('missing')}}},
+            '/vm/{vm}/power': {'get': {'parameters': [vm_param()],
+                                       'responses': {200: {'description': 'ok'}, 404: not_found('gone')}},
+                               'post': {'parameters': [vm_param()], 'responses': {404: not_found('gone')}}},
+            '/host': {'get': {'parameters': [], 'responses': {404: not_found('gone')}}}}
+        parameters, responses = vmsgen.reuse_components(path_dict)
+        # case 1: identical path parameters are moved into the parameters section, query parameters stay inline
+        self.assertEqual({'vm': vm_param()}, parameters)
+        self.assertEqual([{'$ref': '#/parameters/vm'}, {'in': 'query', 'name': 'force', 'type': 'boolean'}],
+                         path_dict['/vm/{vm}']['delete']['parameters'])
+        # case 2: variants of a name are suffixed, the most used one keeping the name
+        self.assertEqual({'std.not_found_error': not_found('gone'), 'std.not_found_error_2': not_found('missing'),
+                          'response': {'description': 'ok'}}, responses)
+        self.assertEqual({200: {'$ref': '#/responses/response'}, 404: {'$ref': '#/responses/std.not_found_error_2'}},
+                         path_dict['/vm/{vm}']['get']['responses'])
+        self.assertEqual({'$ref': '#/responses/std.not_found_error'}, path_dict['/host']['get']['responses'][404])
+        # case 3: inlining restores the components
+        document = {'paths': path_dict, 'parameters': parameters, 'responses': responses}
+        vmsgen.inline_components(document)
+        self.assertEqual(vm_param(), path_dict['/vm/{vm}']['get']['parameters'][0])
+        self.assertEqual(not_found('missing'), path_dict['/vm/{vm}']['delete']['responses'][404])
+        self.assertNotIn('responses', document)
+        # case 4: path parameters are interned as they are built, query parameters aren't
+        field_info = types.SimpleNamespace(name='vm', documentation='vm id',
+                                           type=types.SimpleNamespace(category='BUILTIN', builtin_type='STRING'))
+        vmsgen.REUSE_COMPONENTS = True
+        vmsgen.COMPONENT_REGISTRY = vmsgen.ComponentRegistry()
+        try:
+            refs = [vmsgen.convert_field_info_to_swagger_parameter('path', field_info, {}, None, None)
+                    for _ in range(2)]
+            query_parameter = vmsgen.convert_field_info_to_swagger_parameter('query', field_info, {}, None, None)
+        finally:
+            vmsgen.REUSE_COMPONENTS = False
+        self.assertEqual([{'$ref': '#/parameters/0'}] * 2, refs)
+        self.assertEqual('query', query_parameter['in'])
+        path_dict = {'/vm/{vm}': {'get': {'parameters': [refs[0]]}, 'delete': {'parameters': [refs[1]]}}}
+        self.assertEqual(({'vm': vm_param()}, {}), vmsgen.reuse_components(path_dict))
+        self.assertEqual({'$ref': '#/parameters/vm'}, path_dict['/vm/{vm}']['get']['parameters'][0])
+
+    def test_check_references(self):
+        document = {
+            'paths': {'/vm': {'get': {'parameters': [{'$ref': '#/parameters/vm'}],
+                                      'responses': {200: {'schema': {'$ref': '#/definitions/vm.info'}},
+                                                    404: {'$ref': '#/responses/missing'}}}},
+                      '/host': {'get': {'responses': {200: {'schema': {'$ref': 'common.json#/definitions/x'}}}}}},
+            'parameters': {'vm': {'in': 'path', 'name': 'vm', 'type': 'string'}, 'host': {'in': 'path'}},
+            'definitions': {'vm.info': {'properties': {'spec': {'$ref': '#/definitions/vm.spec'}}},
+                            # recursive, referred to through vm.info
+                            'vm.spec': {'properties': {'children': {'items': {'$ref': '#/definitions/vm.spec'}}}},
+                            'vm.placeholder': {},
+                            'vm.unused': {'properties': {'info': {'$ref': '#/definitions/vm.info'}}}}}
+        # case 1: dangling $refs are reported, external $refs are left alone
+        report = vmsgen.check_references(copy.deepcopy(document), prune=False)
+        self.assertEqual({'#/responses/missing': ['/vm']}, report['dangling'])
+        self.assertEqual([], report['pruned'])
+        # case 2: components which no path refers to are pruned
+        report = vmsgen.check_references(document)
+        self.assertEqual(['vm.placeholder', 'vm.unused', 'host'], report['pruned'])
+        self.assertEqual(['vm.info', 'vm.spec'], sorted(document['definitions']))
+        self.assertEqual(['vm'], list(document['parameters']))
+
+    def test_write_swagger_to_file(self):
+
+        swagger_template = {'swagger': '2.0', 'tags': [], 'info': {'title': 'mock \u00ae'},
+                            'paths': {'/b': {'get': {'responses': {200: {'description': 'ok'}}}}, '/a': {}},
+                            'definitions': {}}
+        sorted_template = dict(swagger_template)
+        sorted_template['paths'] = collections.OrderedDict(sorted(swagger_template['paths'].items()))
+        output_dir = tempfile.mkdtemp()
+        file_name = os.path.join(output_dir, 'mock.json')
+        try:
+            # case 1: indented output of the json backend is identical to json.dump
+            vmsgen.JSON_BACKEND = 'json'
+            vmsgen.write_swagger_to_file(file_name, swagger_template)
+            with open(file_name) as infile:
+                self.assertEqual(json.dumps(sorted_template, indent=4), infile.read())
+
+            # case 2: compact output of the default backend
+            vmsgen.JSON_BACKEND = 'auto'
+            vmsgen.COMPACT_JSON = True
+            vmsgen.write_swagger_to_file(file_name, swagger_template)
+            with open(file_name, 'rb') as infile:
+                content = infile.read()
+            self.assertNotIn(b'\n', content)
+            self.assertEqual(json.loads(json.dumps(sorted_template)), json.loads(content.decode('utf-8')))
+
+            # case 3: the output is the same with either backend, non-ASCII characters included
+            swagger_template['info']['description'] = u'\x7f caf\u00e9 \u2028 \U0001f600'
+            for compact in (False, True):
+                vmsgen.COMPACT_JSON = compact
+                outputs = []
+                for backend in ('json', 'auto'):
+                    vmsgen.JSON_BACKEND = backend
+                    vmsgen.write_swagger_to_file(file_name, swagger_template)
+                    with open(file_name, 'rb') as infile:
+                        outputs.append(infile.read())
+                self.assertEqual(outputs[0], outputs[1])
+                self.assertTrue(outputs[0].isascii())
+        finally:
+            vmsgen.COMPACT_JSON = False
+            vmsgen.JSON_BACKEND = 'auto'
+            os.remove(file_name)
+            os.rmdir(output_dir)
+
 if __name__ == '__main__':
     unittest.main()
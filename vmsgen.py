@@ -13,15 +13,35 @@ from vmware.vapi.stdlib.client.factories import StubConfigurationFactory
 from com.vmware.vapi.metadata import metamodel_client
 import sys
 import os
+import io
 import argparse
+import asyncio
 import collections
+import collections.abc
+import contextlib
+import cProfile
+import fnmatch
 import timeit
 import json
+import hashlib
+import pickle
+import queue
 import threading
+import time
+import zlib
+from concurrent import futures
 import re
 import requests
+from requests.adapters import HTTPAdapter
 import warnings
 warnings.filterwarnings("ignore")
+# asyncio.get_running_loop, contextlib.nullcontext and time.thread_time need Python 3.7.
+if sys.version_info < (3, 7):
+    sys.exit('vmsgen requires Python 3.7 or later')
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def eprint(*args, **kwargs):
@@ -35,6 +55,78 @@ for apis available on vcenter.
 
 GENERATE_UNIQUE_OP_IDS = False
 TAG_SEPARATOR = '/'
+SNAPSHOT_INPUT = None
+SNAPSHOT_OUTPUT = None
+SNAPSHOT_VERSION = 3
+HTTP_POOL_SIZE = 10
+HTTP_CONCURRENCY = 8
+PROCESSES = 0
+COMPACT_JSON = False
+JSON_BACKEND = 'auto'
+SORTED_SWAGGER_SECTIONS = ('paths', 'definitions')
+RESERVED_OP_IDS = ('get', 'set', 'list', 'add', 'run', 'start', 'stop',
+                   'restart', 'reset', 'cancel', 'create', 'update', 'delete')
+BUILTIN_TYPE_NAMES = frozenset(['binary', 'boolean', 'datetime', 'double', 'dynamicstructure', 'exception',
+                                'id', 'long', 'opaque', 'secret', 'string', 'uri'])
+METAMODEL_CACHE_DIR = None
+HTTP_CACHE_DIR = None
+LAZY_METAMODEL = False
+SHARED_DEFINITIONS = False
+REUSE_COMPONENTS = False
+KEEP_UNREFERENCED_DEFINITIONS = False
+# sections of a swagger document holding components which $refs refer to.
+COMPONENT_SECTIONS = ('definitions', 'parameters', 'responses')
+# Swagger documents of the packages with --shared-definitions, which are written once all packages are generated.
+SHARED_DOCUMENTS = {}
+SHARED_DEFINITIONS_FILE = 'common.json'
+# Glob patterns of --packages and --services, empty to generate everything.
+PACKAGE_FILTERS = ()
+SERVICE_FILTERS = ()
+OPERATION_CACHE_DIR = None
+# Bump whenever the generated path objects or definitions change, to invalidate the operation cache.
+OPERATION_CACHE_VERSION = 4
+# Memoized per type id by get_type_closure, the metamodel doesn't change during a run.
+TYPE_DIGESTS = {}
+TYPE_REFERENCES = {}
+# Memoized by get_model_name.
+MODEL_NAMES = {}
+# Regex to look for {} placeholders with a group to match only the parameter name
+RE_PATH_PARAM = re.compile('{(.+?)}')
+# Memoized by parse_url_template.
+URL_TEMPLATES = {}
+RE_PATH_VARIABLE = re.compile(r'\{[^}]*\}')
+# Key of the path groups in PathTrie nodes, can't clash with a path segment.
+PATH_TRIE_GROUP = object()
+# Memoized by get_title.
+TITLES = {}
+GLOBAL_UNIQUE_OP_IDS = False
+# OperationIdIndex shared by all packages with --global-unique-operation-ids.
+OP_ID_INDEX = None
+OP_ID_REPORT = None
+# Operation id collisions resolved by the packages generated in this process.
+OP_ID_COLLISIONS = []
+# Module settings copied into --processes workers, whose module state is not inherited on every platform.
+WORKER_SETTINGS = ('GENERATE_UNIQUE_OP_IDS', 'TAG_SEPARATOR', 'HTTP_POOL_SIZE', 'HTTP_CONCURRENCY',
+                   'OPERATION_CACHE_DIR', 'HTTP_CACHE_DIR', 'COMPACT_JSON', 'JSON_BACKEND', 'STATS_FILE',
+                   'VISITOR_STATS_FILE', 'PROFILE_DIR', 'SERVICE_FILTERS', 'SHARED_DEFINITIONS',
+                   'REUSE_COMPONENTS', 'KEEP_UNREFERENCED_DEFINITIONS')
+PACKAGE_WORKER_STATE = None
+HTTP_SESSION = None
+HTTP_SESSION_LOCK = threading.Lock()
+# Types whose conversion is in progress on the current thread, see check_type.
+TYPE_CONVERSION_STATE = threading.local()
+STATS_FILE = None
+# StatsRecorder of --stats, None if disabled.
+STATS = None
+# Package generated on the current thread, counters are recorded for it.
+STATS_STATE = threading.local()
+NO_STATS = contextlib.nullcontext()
+VISITOR_STATS_FILE = None
+# VisitorStats of --visitor-stats, None if disabled.
+VISITOR_STATS = None
+PROFILE_DIR = None
+# cProfile can only profile one thread at a time on recent Python versions.
+PROFILE_LOCK = threading.Lock()
 
 
 def build_error_map():
@@ -90,34 +182,737 @@ def write_json_data_to_file(file_name, json_data):
         json.dump(json_data, outfile, indent=4)
 
 
+RE_LEADING_SPACES = re.compile(b'^ +', re.MULTILINE)
+# characters which json.dumps escapes and orjson writes as they are.
+RE_UNESCAPED_BYTES = re.compile(b'[\x7f-\xff]')
+RE_UNESCAPED_CHARACTERS = re.compile(u'[\x7f-\U0010ffff]+')
+
+
+def use_orjson():
+    return orjson is not None and JSON_BACKEND != 'json'
+
+
+def encode_json(value, indent_level):
+    """
+    Encodes value to utf-8 JSON, either compact or indented by 4 spaces as if it were nested
+    indent_level levels deep.
+    """
+    if COMPACT_JSON:
+        if use_orjson():
+            return escape_orjson(orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS))
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+    if use_orjson():
+        # orjson only indents by 2 spaces, double the indentation of every line.
+        encoded = escape_orjson(orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2))
+        encoded = RE_LEADING_SPACES.sub(lambda match: match.group(0) * 2, encoded)
+    else:
+        encoded = json.dumps(value, indent=4).encode('utf-8')
+    if indent_level > 0:
+        encoded = encoded.replace(b'\n', b'\n' + b' ' * (4 * indent_level))
+    return encoded
+
+
+def escape_orjson(encoded):
+    """
+    Escapes the non-ASCII characters and DEL of orjson output like json.dumps does, so that the output
+    doesn't depend on the JSON backend. They can only occur in strings.
+    """
+    if RE_UNESCAPED_BYTES.search(encoded) is None:
+        return encoded
+    return RE_UNESCAPED_CHARACTERS.sub(lambda match: json.dumps(match.group(0))[1:-1],
+                                       encoded.decode('utf-8')).encode('ascii')
+
+
+def write_swagger_to_file(file_name, swagger_template):
+    """
+    Streams a swagger document to a buffered file. The entries of the SORTED_SWAGGER_SECTIONS are
+    encoded one at a time in key order, so that no sorted copy of paths and definitions is built and
+    no single large string is held in memory. JSON_BACKEND 'auto' uses orjson if it is installed, the output
+    is the same with either backend.
+    """
+    if COMPACT_JSON:
+        newline, item_separator, key_separator = b'', b',', b':'
+    else:
+        newline, item_separator, key_separator = b'\n', b',', b': '
+
+    def indentation(level):
+        return b'' if COMPACT_JSON else b' ' * (4 * level)
+
+    with io.open(file_name, 'wb', buffering=1 << 20) as outfile:
+        outfile.write(b'{')
+        for index, (key, value) in enumerate(swagger_template.items()):
+            if index > 0:
+                outfile.write(item_separator)
+            outfile.write(newline + indentation(1) + encode_json(key, 0) + key_separator)
+            if key not in SORTED_SWAGGER_SECTIONS or not value:
+                outfile.write(encode_json(value, 1))
+                continue
+            outfile.write(b'{')
+            for item_index, item_key in enumerate(sorted(value)):
+                if item_index > 0:
+                    outfile.write(item_separator)
+                outfile.write(newline + indentation(2) + encode_json(item_key, 0) + key_separator)
+                outfile.write(encode_json(value[item_key], 2))
+            outfile.write(newline + indentation(1) + b'}')
+        outfile.write(newline + b'}')
+
+
+class SnapshotDict(collections.abc.Mapping):
+    """
+    Read-only mapping over one section of a metamodel snapshot.
+    Values are kept as compressed pickles and unpickled the first time they are looked up,
+    so loading a snapshot only costs reading the file.
+    """
+
+    def __init__(self, blobs):
+        self._blobs = blobs
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = pickle.loads(zlib.decompress(self._blobs[key]))
+            self._values[key] = value
+            return value
+
+    def __contains__(self, key):
+        return key in self._blobs
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __getstate__(self):
+        # ship only the compressed values to --processes workers
+        return {'_blobs': self._blobs}
+
+    def __setstate__(self, state):
+        self._blobs = state['_blobs']
+        self._values = {}
+
+
+def save_snapshot(file_name, metadata_url, rest_navigation_url, enumeration_dict, structure_dict, service_dict,
+                  service_urls_map, service_operations_dict):
+    """
+    Writes the metamodel dictionaries, the rest navigation service url map and the prefetched
+    ?~method=OPTIONS documents to file_name,
+    so that later runs can be started with --from-snapshot instead of querying vCenter.
+    Every value is pickled and compressed separately, which lets load_snapshot defer unpickling.
+    """
+    sections = {'enumerations': enumeration_dict,
+                'structures': structure_dict,
+                'services': service_dict,
+                'service_urls': service_urls_map,
+                'service_operations': service_operations_dict}
+    snapshot = {'version': SNAPSHOT_VERSION,
+                'metadata_url': metadata_url,
+                'rest_navigation_url': rest_navigation_url,
+                'sections': {}}
+    for section, section_dict in sections.items():
+        snapshot['sections'][section] = collections.OrderedDict(
+            (key, zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            for key, value in section_dict.items())
+    with open(file_name, 'wb') as outfile:
+        pickle.dump(snapshot, outfile, pickle.HIGHEST_PROTOCOL)
+
+
+def load_snapshot(file_name):
+    """
+    Loads a snapshot written by save_snapshot.
+    :return: metadata url, rest navigation url, enumeration dict, structure dict, service dict,
+     rest navigation service url map and service operations dict
+    """
+    with open(file_name, 'rb') as infile:
+        snapshot = pickle.load(infile)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version %s in %s' % (snapshot.get('version'), file_name))
+    sections = snapshot['sections']
+    return (snapshot['metadata_url'], snapshot['rest_navigation_url'],
+            SnapshotDict(sections['enumerations']), SnapshotDict(sections['structures']),
+            SnapshotDict(sections['services']), SnapshotDict(sections['service_urls']),
+            SnapshotDict(sections['service_operations']))
+
+
+def get_http_session():
+    """
+    Returns the keep-alive session shared by all rest navigation requests.
+    The session is created on first use; its connection pool holds HTTP_POOL_SIZE connections per host
+    and is safe to use from the package threads.
+    """
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        with HTTP_SESSION_LOCK:
+            if HTTP_SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                HTTP_SESSION = session
+    return HTTP_SESSION
+
+
+class SchemaCache(object):
+    """
+    Process wide cache of converted structure and enumeration schemas keyed by type id,
+    shared by all package threads. Every entry also keeps the (resource type, type id) pairs
+    the schema refers to, so that a package taking a schema from the cache can add its
+    dependencies to its own type_dict. Schemas are copied in and out because the
+    post processing steps modify type_dict in place.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, type_name):
+        """
+        :return: tuple of a copy of the schema and its dependencies, None if type_name is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(type_name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy_schema(entry[0]), entry[1]
+
+    def __contains__(self, type_name):
+        """
+        Tells whether type_name is cached, without counting a hit or a miss.
+        """
+        with self.lock:
+            return type_name in self.entries
+
+    def put(self, type_name, schema, dependencies):
+        entry = (copy_schema(schema), tuple(dependencies))
+        with self.lock:
+            self.entries.setdefault(type_name, entry)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+SCHEMA_CACHE = SchemaCache()
+
+
+def copy_schema(schema):
+    """
+    Copies a schema made of dicts, lists and immutable values. Much cheaper than copy.deepcopy.
+    """
+    if isinstance(schema, dict):
+        return {key: copy_schema(value) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [copy_schema(value) for value in schema]
+    return schema
+
+
+def read_cache_file(file_name, keys):
+    """
+    Returns the unpickled content of a cache file, None if it doesn't exist or can't be read.
+    :param keys: keys the content must have. Files written by other versions without them are ignored.
+    """
+    try:
+        with open(file_name, 'rb') as infile:
+            value = pickle.load(infile)
+    except (IOError, OSError):
+        return None
+    except Exception as ex:
+        eprint('Ignoring unreadable cache file ' + file_name)
+        eprint(ex)
+        return None
+    if not isinstance(value, dict) or any(key not in value for key in keys):
+        eprint('Ignoring cache file of another version ' + file_name)
+        return None
+    return value
+
+
+def write_cache_file(file_name, value):
+    """
+    Pickles value into a cache file. The file is written under a temporary name and renamed,
+    so that concurrent readers never see a partially written file.
+    """
+    directory = os.path.dirname(file_name)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created concurrently
+            pass
+    temp_file_name = '%s.%d.%d.tmp' % (file_name, os.getpid(), threading.current_thread().ident)
+    with open(temp_file_name, 'wb') as outfile:
+        pickle.dump(value, outfile, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_name, file_name)
+
+
+class StatsRecorder(object):
+    """
+    Collects the wall and CPU time of the phases of a run and counters for --stats, both for the whole
+    run and for every package. Run phases take the CPU time of the process, package phases the CPU
+    time of the thread generating the package.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.packages = {}
+
+    def get_package(self, package_name):
+        with self.lock:
+            return self.packages.setdefault(package_name, {'phases': collections.OrderedDict(),
+                                                           'counters': collections.Counter()})
+
+    @contextlib.contextmanager
+    def phase(self, name, package_name=None):
+        if package_name is None:
+            phases, cpu_timer = self.phases, time.process_time
+        else:
+            phases, cpu_timer = self.get_package(package_name)['phases'], time.thread_time
+        wall_start, cpu_start = timeit.default_timer(), cpu_timer()
+        try:
+            yield
+        finally:
+            wall, cpu = timeit.default_timer() - wall_start, cpu_timer() - cpu_start
+            with self.lock:
+                totals = phases.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+                totals['wall_seconds'] += wall
+                totals['cpu_seconds'] += cpu
+
+    def count(self, name, amount=1):
+        """
+        Adds amount to a run counter and, on a package thread, to the counter of the package.
+        """
+        package_name = getattr(STATS_STATE, 'package', None)
+        package = self.get_package(package_name) if package_name is not None else None
+        with self.lock:
+            self.counters[name] += amount
+            if package is not None:
+                package['counters'][name] += amount
+
+    def add_package(self, package_name, package_stats):
+        """
+        Adds the stats of a package generated in a --processes worker.
+        """
+        with self.lock:
+            self.packages[package_name] = package_stats
+            self.counters.update(package_stats['counters'])
+
+    def report(self):
+        with self.lock:
+            packages = {}
+            for package_name, package in self.packages.items():
+                counters = dict(package['counters'])
+                conversion = package['phases'].get('conversion')
+                if conversion and conversion['wall_seconds'] > 0:
+                    counters['operations_per_second'] = counters.get('operations', 0) / conversion['wall_seconds']
+                packages[package_name] = {'phases': package['phases'], 'counters': counters}
+            return {'phases': self.phases, 'counters': dict(self.counters), 'packages': packages}
+
+
+def record_phase(name, package_name=None):
+    """
+    Returns a context manager which records the time of a phase if --stats is set.
+    """
+    if STATS is None:
+        return NO_STATS
+    return STATS.phase(name, package_name)
+
+
+def count_stat(name, amount=1):
+    if STATS is not None:
+        STATS.count(name, amount)
+
+
+def write_stats_report(file_name):
+    report = STATS.report()
+    report['settings'] = {'processes': PROCESSES, 'http_concurrency': HTTP_CONCURRENCY,
+                          'json_backend': JSON_BACKEND, 'compact_json': COMPACT_JSON,
+                          'unique_operation_ids': bool(GENERATE_UNIQUE_OP_IDS)}
+    write_json_data_to_file(file_name, report)
+
+
+class VisitorStats(object):
+    """
+    Instrumentation of the type conversion functions for --visitor-stats: call counts, outcome of check_type,
+    maximum recursion depth and time spent converting every structure and enumeration.
+    install rebinds the module functions to counting wrappers, so the functions are untouched when disabled.
+    Counters are kept per thread and added up by report, the wrappers take no lock.
+    """
+
+    FUNCTIONS = ('visit_type_category', 'visit_type_category_dict', 'visit_builtin', 'visit_generic',
+                 'visit_user_defined', 'check_type', 'process_structure_info', 'process_enum_info')
+    TIMED_FUNCTIONS = ('process_structure_info', 'process_enum_info')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread_states = []
+        self.merged = []
+        self.originals = {}
+
+    def get_state(self):
+        try:
+            return self.local.state
+        except AttributeError:
+            state = self.local.state = {'calls': collections.Counter(), 'check_type': collections.Counter(),
+                                        'depth': 0, 'max_depth': 0, 'timers': [], 'types': {}}
+            with self.lock:
+                self.thread_states.append(state)
+            return state
+
+    def install(self):
+        module = globals()
+        for name in self.FUNCTIONS:
+            self.originals[name] = module[name]
+            if name in self.TIMED_FUNCTIONS:
+                module[name] = self.timed(name, module[name])
+            elif name == 'check_type':
+                module[name] = self.counted_check_type(module[name])
+            else:
+                module[name] = self.counted(name, module[name])
+
+    def uninstall(self):
+        globals().update(self.originals)
+        self.originals = {}
+
+    def counted(self, name, function):
+        def wrapper(*args, **kwargs):
+            state = self.get_state()
+            state['calls'][name] += 1
+            state['depth'] += 1
+            if state['depth'] > state['max_depth']:
+                state['max_depth'] = state['depth']
+            try:
+                return function(*args, **kwargs)
+            finally:
+                state['depth'] -= 1
+        return wrapper
+
+    def counted_check_type(self, function):
+        counted_function = self.counted('check_type', function)
+
+        def wrapper(resource_type, type_name, type_dict, structure_svc, enum_svc):
+            if is_type_builtin(type_name):
+                outcome = 'builtin'
+            elif get_model_name(type_name) in type_dict:
+                outcome = 'already_converted'
+            elif type_name in SCHEMA_CACHE:
+                outcome = 'schema_cache'
+            else:
+                outcome = 'converted'
+            self.get_state()['check_type'][outcome] += 1
+            return counted_function(resource_type, type_name, type_dict, structure_svc, enum_svc)
+        return wrapper
+
+    def timed(self, name, function):
+        """
+        Times the conversion of a type. Nested conversions are subtracted from the self time of a type.
+        """
+        counted_function = self.counted(name, function)
+
+        def wrapper(model_name, *args, **kwargs):
+            state = self.get_state()
+            timers = state['timers']
+            timers.append(0.0)
+            start = timeit.default_timer()
+            try:
+                return counted_function(model_name, *args, **kwargs)
+            finally:
+                elapsed = timeit.default_timer() - start
+                nested = timers.pop()
+                if timers:
+                    timers[-1] += elapsed
+                type_stats = state['types'].setdefault(model_name, [0, 0.0, 0.0])
+                type_stats[0] += 1
+                type_stats[1] += elapsed
+                type_stats[2] += elapsed - nested
+        return wrapper
+
+    def merge(self, report):
+        """
+        Adds the report of a --processes worker.
+        """
+        with self.lock:
+            self.merged.append(report)
+
+    def report(self):
+        calls = collections.Counter()
+        check_type_outcomes = collections.Counter()
+        max_depth = 0
+        types = {}
+        with self.lock:
+            states = list(self.thread_states)
+            merged = list(self.merged)
+        for state in states:
+            calls.update(state['calls'])
+            check_type_outcomes.update(state['check_type'])
+            max_depth = max(max_depth, state['max_depth'])
+            for model_name, (count, inclusive, exclusive) in state['types'].items():
+                totals = types.setdefault(model_name, {'conversions': 0, 'seconds': 0.0, 'self_seconds': 0.0})
+                totals['conversions'] += count
+                totals['seconds'] += inclusive
+                totals['self_seconds'] += exclusive
+        for report in merged:
+            calls.update(report['calls'])
+            check_type_outcomes.update(report['check_type'])
+            max_depth = max(max_depth, report['max_depth'])
+            for model_name, type_stats in report['types'].items():
+                totals = types.setdefault(model_name, {'conversions': 0, 'seconds': 0.0, 'self_seconds': 0.0})
+                for key in totals:
+                    totals[key] += type_stats[key]
+        # share of the user defined types which didn't have to be converted again
+        lookups = sum(check_type_outcomes.values()) - check_type_outcomes['builtin']
+        return {'calls': dict(calls), 'check_type': dict(check_type_outcomes),
+                'check_type_hit_ratio': (lookups - check_type_outcomes['converted']) / lookups if lookups else None,
+                'max_depth': max_depth,
+                'types': collections.OrderedDict(sorted(types.items(),
+                                                        key=lambda item: -item[1]['self_seconds']))}
+
+
+@contextlib.contextmanager
+def profile_package(package_name):
+    """
+    Profiles the generation of a package with cProfile and dumps the pstats to PROFILE_DIR/<package>.pstats.
+    Packages are profiled one at a time.
+    """
+    if PROFILE_DIR is None:
+        yield
+        return
+    with PROFILE_LOCK:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if not os.path.isdir(PROFILE_DIR):
+                os.makedirs(PROFILE_DIR)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, package_name + '.pstats'))
+
+
 def get_json(url, verify=True):
+    """
+    Gets a JSON document and removes its 'value' wrapper.
+    If HTTP_CACHE_DIR is set, documents are stored with their ETag and Last-Modified validators and
+    revalidated with a conditional request, an unchanged document is then read from the cache.
+    """
+    cache_file = None
+    cached = None
+    request_headers = {}
+    if HTTP_CACHE_DIR is not None:
+        cache_file = get_http_cache_file(url)
+        cached = read_cache_file(cache_file, ('etag', 'last_modified', 'data'))
+        if cached is not None:
+            if cached['etag'] is not None:
+                request_headers['If-None-Match'] = cached['etag']
+            if cached['last_modified'] is not None:
+                request_headers['If-Modified-Since'] = cached['last_modified']
     try:
-        req = requests.get(url, verify=verify)
+        if request_headers:
+            req = get_http_session().get(url, verify=verify, headers=request_headers)
+        else:
+            req = get_http_session().get(url, verify=verify)
     except Exception as ex:
-        eprint('Cannot Load %s - %s' % (url, req.content))
+        eprint('Cannot Load %s' % url)
         eprint(ex)
         return None
+    if STATS is not None:
+        STATS.count('http_requests')
+        STATS.count('http_bytes', len(req.content))
+    if cached is not None and req.status_code == http_client.NOT_MODIFIED:
+        count_stat('http_not_modified')
+        return cached['data']
     if not req.ok:
         eprint('Cannot Load %s - %s' % (url, req.content))
         return None
-    if 'value' in req.json():
-        return req.json()['value']
-    return req.json()
+    data = req.json()
+    if 'value' in data:
+        data = data['value']
+    if cache_file is not None:
+        etag = req.headers.get('ETag')
+        last_modified = req.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            write_cache_file(cache_file, {'url': url, 'etag': etag, 'last_modified': last_modified, 'data': data})
+    return data
 
 
-def get_component_services_urls(cloudvm_url, verify=True):
-    components_url = get_json(cloudvm_url, verify)['components']['href']
-    components = get_json(components_url, verify)
-    return [component['services']['href'] for component in components]
+def get_http_cache_file(url):
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(HTTP_CACHE_DIR, url_hash[:2], url_hash + '.pickle')
 
 
-def get_all_services_urls(components_urls, verify=True):
-    service_url_dict = {}
-    for url in components_urls:
-        services = get_json(url, verify)
-        for service in services:
-            service_url_dict[service['href']] = service['name']
-    return service_url_dict
+def is_package_selected(package_name):
+    """
+    Returns whether a package matches one of the --packages patterns, True without --packages.
+    """
+    return not PACKAGE_FILTERS or any(fnmatch.fnmatchcase(package_name, pattern) for pattern in PACKAGE_FILTERS)
+
+
+def is_service_selected(service_id):
+    """
+    Returns whether a service id, e.g. com.vmware.vcenter.VM, matches one of the --services patterns
+    and its package one of the --packages patterns.
+    """
+    if SERVICE_FILTERS and not any(fnmatch.fnmatchcase(service_id, pattern) for pattern in SERVICE_FILTERS):
+        return False
+    service_id_parts = service_id.split('.')
+    return len(service_id_parts) < 3 or is_package_selected(service_id_parts[2])
+
+
+def is_component_selected(component_id):
+    """
+    Returns whether a metamodel or rest navigation component may contain selected services.
+    The services of component com.vmware.vcenter are in package vcenter, components with shorter ids
+    may contain any package.
+    """
+    component_id_parts = component_id.split('.')
+    return len(component_id_parts) < 3 or is_package_selected(component_id_parts[2])
+
+
+def select_service_urls(service_urls_map):
+    """
+    Returns the entries of service_urls_map whose service is selected by --packages and --services.
+    """
+    if not PACKAGE_FILTERS and not SERVICE_FILTERS:
+        return service_urls_map
+    return {service_url: service_id for service_url, service_id in service_urls_map.items()
+            if is_service_selected(service_id)}
+
+
+async def crawl_rest_navigation(rest_navigation_url, verify, emit):
+    """
+    Walks rest navigation: /rest -> components -> services of every component.
+    The services lists of all components are requested concurrently; get_json is blocking,
+    so it runs on an executor of HTTP_CONCURRENCY threads.
+    :param emit: called with a (service url, service id) tuple for every discovered service selected by
+     --packages and --services
+    :raises ValueError: if the rest navigation root or its components list can't be read. A component whose
+     services list can't be read is skipped, get_json reports the error.
+    """
+    loop = asyncio.get_running_loop()
+    executor = futures.ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY)
+
+    def fetch(url):
+        return loop.run_in_executor(executor, get_json, url, verify)
+
+    try:
+        rest_navigation = await fetch(rest_navigation_url)
+        if rest_navigation is None:
+            raise ValueError('Cannot read rest navigation at ' + rest_navigation_url)
+        components_url = rest_navigation['components']['href']
+        components = await fetch(components_url)
+        if components is None:
+            raise ValueError('Cannot read rest navigation components at ' + components_url)
+        # the services lists of components of packages which are not selected are not requested.
+        components = [component for component in components
+                      if 'name' not in component or is_component_selected(component['name'])]
+        for services in asyncio.as_completed([fetch(component['services']['href']) for component in components]):
+            services = await services
+            if services is None:
+                continue
+            for service in services:
+                if is_service_selected(service['name']):
+                    emit((service['href'], service['name']))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def iter_service_urls_from_rest_navigation(rest_navigation_url, verify=True):
+    """
+    Yields (service url, service id) tuples as soon as the services list of their component is received.
+    The crawl runs in an event loop on a background thread, so the caller can consume the stream incrementally.
+    """
+    discovered = queue.Queue()
+    done = object()
+
+    def crawl():
+        try:
+            asyncio.run(crawl_rest_navigation(rest_navigation_url, verify, discovered.put))
+        except Exception as ex:
+            discovered.put(ex)
+        finally:
+            discovered.put(done)
+
+    crawler = threading.Thread(target=crawl)
+    crawler.daemon = True
+    crawler.start()
+    while True:
+        item = discovered.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def collect_service_urls(service_url_stream, service_urls_map):
+    """
+    Records every (service url, service id) tuple of the stream in service_urls_map
+    and yields each distinct service url once.
+    """
+    for service_url, service_id in service_url_stream:
+        if service_url not in service_urls_map:
+            service_urls_map[service_url] = service_id
+            yield service_url
+
+
+def get_options_service_urls(service_urls, service_dict, service_url_dict):
+    """
+    Returns the service urls whose REST mappings have to be fetched through ?~method=OPTIONS,
+    i.e. known services which have operations without RequestMapping annotation.
+    """
+    options_service_urls = []
+    for service_url in service_urls:
+        service_info = service_dict.get(service_url_dict.get(service_url, None), None)
+        if service_info is not None and not contains_rm_annotation(service_info):
+            options_service_urls.append(service_url)
+    return options_service_urls
+
+
+def prefetch_service_operations(service_urls, service_dict, service_url_dict):
+    """
+    Fetches the ?~method=OPTIONS documents of all services which need them on a pool of
+    HTTP_CONCURRENCY threads, so that the package threads don't wait on sequential round trips.
+    :return: dict which maps service url to its operations. The value is None if the request failed.
+    """
+    service_operations_dict = {}
+    options_service_urls = get_options_service_urls(service_urls, service_dict, service_url_dict)
+    if not options_service_urls:
+        return service_operations_dict
+    with futures.ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY) as executor:
+        future_to_url = {executor.submit(get_json, service_url + '?~method=OPTIONS', False): service_url
+                         for service_url in options_service_urls}
+        for future in futures.as_completed(future_to_url):
+            service_operations_dict[future_to_url[future]] = future.result()
+    return service_operations_dict
+
+
+def get_model_name(type_id):
+    """
+    Returns the name under which a type is emitted in the definitions: 'com.vmware.' is removed
+    and $ is replaced with _.
+    """
+    try:
+        return MODEL_NAMES[type_id]
+    except KeyError:
+        model_name = type_id.replace('com.vmware.', '').replace('$', '_')
+        MODEL_NAMES[type_id] = model_name
+        return model_name
+
+
+def get_model_description(documentation):
+    """
+    Removes 'com.vmware.' from documentation which is emitted as summary or description.
+    """
+    if documentation is None:
+        return None
+    return documentation.replace('com.vmware.', '')
 
 
 def get_structure_info(struct_type, structure_svc):
@@ -232,14 +1027,14 @@ def visit_generic(generic_instantiation, new_prop, type_dict, structure_svc, enu
         if generic_instantiation.map_key_type.category == 'USER_DEFINED':
             res_id = generic_instantiation.map_key_type.user_defined_type.resource_id
             res_type = generic_instantiation.map_key_type.user_defined_type.resource_type
-            new_type['properties']['key'] = {'$ref': '#/definitions/' + res_id}
+            new_type['properties']['key'] = {'$ref': '#/definitions/' + get_model_name(res_id)}
             check_type(res_type, res_id, type_dict, structure_svc, enum_svc)
         else:
             new_type['properties']['key'] = {'type': metamodel_to_swagger_type_converter(
                 generic_instantiation.map_key_type.builtin_type)[0]}
         if generic_instantiation.map_value_type.category == 'USER_DEFINED':
             new_type['properties']['value'] = {
-                '$ref': '#/definitions/' + generic_instantiation.map_value_type.user_defined_type.resource_id}
+                '$ref': '#/definitions/' + get_model_name(generic_instantiation.map_value_type.user_defined_type.resource_id)}
             res_type = generic_instantiation.map_value_type.user_defined_type.resource_type
             res_id = generic_instantiation.map_value_type.user_defined_type.resource_id
             check_type(res_type, res_id, type_dict, structure_svc, enum_svc)
@@ -250,6 +1045,9 @@ def visit_generic(generic_instantiation, new_prop, type_dict, structure_svc, enu
             new_type['properties']['value'] = {}
             visit_generic(generic_instantiation.map_value_type.generic_instantiation,
                           new_type['properties']['value'], type_dict, structure_svc, enum_svc)
+            # optional map values are references, which don't take a required flag.
+            if '$ref' in new_type['properties']['value']:
+                new_type['properties']['value'].pop('required', None)
         new_prop['type'] = 'array'
         new_prop['items'] = new_type
         if '$ref' in new_prop:
@@ -257,18 +1055,13 @@ def visit_generic(generic_instantiation, new_prop, type_dict, structure_svc, enu
 
 
 def is_type_builtin(type_):
-    type_ = type_.lower()
-    typeset = {'binary', 'boolean', 'datetime', 'double', 'dynamicstructure', 'exception',
-               'id', 'long', 'opaque', 'secret', 'string', 'uri'}
-    if type_ in typeset:
-        return True
-    return False
+    return type_.lower() in BUILTIN_TYPE_NAMES
 
 
-def process_structure_info(type_name, structure_info, type_dict, structure_svc, enum_svc):
+def process_structure_info(model_name, structure_info, type_dict, structure_svc, enum_svc):
     new_type = {'type': 'object', 'properties': {}}
     for field in structure_info.fields:
-        newprop = {'description': field.documentation}
+        newprop = {'description': get_model_description(field.documentation)}
         if field.type.category == 'BUILTIN':
             visit_builtin(field.type.builtin_type, newprop)
         elif field.type.category == 'GENERIC':
@@ -286,30 +1079,66 @@ def process_structure_info(type_name, structure_info, type_dict, structure_svc,
             required.append(property_name)
     if len(required) > 0:
         new_type['required'] = required
-    type_dict[type_name] = new_type
+    type_dict[model_name] = new_type
 
 
-def process_enum_info(type_name, enum_info, type_dict):
-    enum_type = {'type': 'string', 'description': enum_info.documentation}
+def process_enum_info(model_name, enum_info, type_dict):
+    enum_type = {'type': 'string', 'description': get_model_description(enum_info.documentation)}
     enum_type.setdefault('enum', [value.value for value in enum_info.values])
-    type_dict[type_name] = enum_type
+    type_dict[model_name] = enum_type
 
 
 def check_type(resource_type, type_name, type_dict, structure_svc, enum_svc):
-    if type_name in type_dict or is_type_builtin(type_name):
+    if is_type_builtin(type_name):
+        return
+    # Record the reference as a dependency of the structure being converted, if any.
+    conversion_stack = get_type_conversion_stack()
+    if conversion_stack and conversion_stack[-1] is not None:
+        conversion_stack[-1].append((resource_type, type_name))
+    model_name = get_model_name(type_name)
+    if model_name in type_dict:
+        return
+    cached = SCHEMA_CACHE.get(type_name)
+    if cached is not None:
+        schema, dependencies = cached
+        type_dict[model_name] = schema
+        conversion_stack.append(None)
+        try:
+            for dependency_type, dependency_name in dependencies:
+                check_type(dependency_type, dependency_name, type_dict, structure_svc, enum_svc)
+        finally:
+            conversion_stack.pop()
         return
     if resource_type == 'com.vmware.vapi.structure':
         structure_info = get_structure_info(type_name, structure_svc)
         if structure_info is not None:
             # Mark it as visited to handle recursive definitions. (Type A referring to Type A in one of the fields).
-            type_dict[type_name] = {}
-            process_structure_info(type_name, structure_info, type_dict, structure_svc, enum_svc)
+            type_dict[model_name] = {}
+            dependencies = []
+            conversion_stack.append(dependencies)
+            try:
+                process_structure_info(model_name, structure_info, type_dict, structure_svc, enum_svc)
+            finally:
+                conversion_stack.pop()
+            SCHEMA_CACHE.put(type_name, type_dict[model_name], dependencies)
     else:
         enum_info = get_enum_info(type_name, enum_svc)
         if enum_info is not None:
             # Mark it as visited to handle recursive definitions. (Type A referring to Type A in one of the fields).
-            type_dict[type_name] = {}
-            process_enum_info(type_name, enum_info, type_dict)
+            type_dict[model_name] = {}
+            process_enum_info(model_name, enum_info, type_dict)
+            SCHEMA_CACHE.put(type_name, type_dict[model_name], ())
+
+
+def get_type_conversion_stack():
+    """
+    Returns the stack of dependency lists of the structures being converted on the current thread.
+    """
+    try:
+        return TYPE_CONVERSION_STATE.stack
+    except AttributeError:
+        TYPE_CONVERSION_STATE.stack = []
+        return TYPE_CONVERSION_STATE.stack
 
 
 def get_enum_info(type_name, enum_svc):
@@ -331,11 +1160,11 @@ def visit_user_defined(user_defined_type, newprop, type_dict, structure_svc, enu
     if user_defined_type.resource_id is None:
         return
     if 'type' in newprop and newprop['type'] == 'array':
-        item_obj = {'$ref': '#/definitions/' + user_defined_type.resource_id}
+        item_obj = {'$ref': '#/definitions/' + get_model_name(user_defined_type.resource_id)}
         newprop['items'] = item_obj
     # if not array, fill in type or ref
     else:
-        newprop['$ref'] = '#/definitions/' + user_defined_type.resource_id
+        newprop['$ref'] = '#/definitions/' + get_model_name(user_defined_type.resource_id)
 
     check_type(user_defined_type.resource_type, user_defined_type.resource_id, type_dict, structure_svc, enum_svc)
 
@@ -364,12 +1193,14 @@ def convert_field_info_to_swagger_parameter(param_type, input_parameter_obj, typ
         parameter_obj['required'] = True
     parameter_obj['in'] = param_type
     parameter_obj['name'] = input_parameter_obj.name
-    parameter_obj['description'] = input_parameter_obj.documentation
+    parameter_obj['description'] = get_model_description(input_parameter_obj.documentation)
     # $ref should be encapsulated in 'schema' instead of parameter.
     if '$ref' in parameter_obj:
         schema_obj = {'$ref': parameter_obj['$ref']}
         parameter_obj['schema'] = schema_obj
         del parameter_obj['$ref']
+    if param_type == 'path':
+        return intern_component('parameters', parameter_obj)
     return parameter_obj
 
 
@@ -387,7 +1218,7 @@ def get_response_object_name(service_id, operation_id):
 
 def populate_response_map(output, errors, error_map, type_dict, structure_svc, enum_svc, service_id, operation_id):
     response_map = {}
-    success_response = {'description': output.documentation}
+    success_response = {'description': get_model_description(output.documentation)}
     schema = find_output_schema(output, type_dict, structure_svc, enum_svc)
     # if type of schema is void, don't include it.
     # this prevents showing response as void in swagger-ui
@@ -396,22 +1227,24 @@ def populate_response_map(output, errors, error_map, type_dict, structure_svc, e
             value_wrapper = {'type': 'object',
                              'properties': {'value': schema},
                              'required': ['value']}
-            type_name = get_response_object_name(service_id, operation_id) + '_result'
+            type_name = get_model_name(get_response_object_name(service_id, operation_id) + '_result')
             if type_name not in type_dict:
                 type_dict[type_name] = value_wrapper
             success_response['schema'] = {"$ref": "#/definitions/" + type_name}
     # success response is not mapped through metamodel.
     # hardcode it for now.
-    response_map[requests.codes.ok] = success_response
+    response_map[requests.codes.ok] = intern_component('responses', success_response)
     for error in errors:
         status_code = error_map.get(error.structure_id, http_client.INTERNAL_SERVER_ERROR)
         check_type('com.vmware.vapi.structure', error.structure_id, type_dict, structure_svc, enum_svc)
-        schema_obj = {'type': 'object', 'properties': {'type': {'type': 'string'},
-                                                       'value': {'$ref': '#/definitions/' + error.structure_id}}}
-        type_dict[error.structure_id + '_error'] = schema_obj
-        response_obj = {'description': error.documentation, 'schema': {'$ref': '#/definitions/'
-                                                                               + error.structure_id + '_error'}}
-        response_map[status_code] = response_obj
+        error_model_name = get_model_name(error.structure_id)
+        if error_model_name + '_error' not in type_dict:
+            type_dict[error_model_name + '_error'] = {
+                'type': 'object', 'properties': {'type': {'type': 'string'},
+                                                 'value': {'$ref': '#/definitions/' + error_model_name}}}
+        response_obj = {'description': get_model_description(error.documentation),
+                        'schema': {'$ref': '#/definitions/' + error_model_name + '_error'}}
+        response_map[status_code] = intern_component('responses', response_obj)
     return response_map
 
 
@@ -519,64 +1352,31 @@ def convert_path_list_to_path_map(path_list):
     return path_dict
 
 
-def cleanup(path_dict, type_dict):
-    for _, type_object in six.iteritems(type_dict):
-        if 'properties' in type_object:
-            properties = type_object['properties']
-            for _, property_value in six.iteritems(properties):
-                if 'required' in property_value and isinstance(property_value['required'], bool):
-                    del property_value['required']
-    for _, path_value in six.iteritems(path_dict):
-        for _, method_value in six.iteritems(path_value):
-            if 'path' in method_value:
-                del method_value['path']
-            if 'method' in method_value:
-                del method_value['method']
-
-
-def remove_com_vmware_from_dict(swagger_obj, depth=0, keys_list=[]):
-    """
-    The method
-    1. removes 'com.vmware.' from model names
-    2. replaces $ with _ from the model names
-
-    This is done on both definitions and path
-    'definitions' : where models are defined and may be referenced.
-    'path' : where models are referenced.
-    :param swagger_obj: should be path of definitions dictionary
-    :param depth: depth of the dictionary. Defaults to 0
-    :param keys_list: List of updated model names
-    :return:
+def remove_required_flags(type_object):
     """
-    if isinstance(swagger_obj, dict):
-        if '$ref' in swagger_obj and 'required' in swagger_obj:
-            del swagger_obj['required']
-        for key, item in swagger_obj.items():
-            if isinstance(item, str):
-                if key in ('$ref', 'summary', 'description'):
-                    item = item.replace('com.vmware.', '')
-                    if key == '$ref':
-                        item = item.replace('$', '_')
-                    swagger_obj[key] = item
-            elif isinstance(item, list):
-                for itm in item:
-                    remove_com_vmware_from_dict(itm, depth+1, keys_list)
-            elif isinstance(item, dict):
-                if depth == 0 and isinstance(key, str) and (key.startswith('com.vmware.') or '$' in key):
-                    keys_list.append(key)
-                remove_com_vmware_from_dict(item, depth+1, keys_list)
-    elif isinstance(swagger_obj, list):
-        for itm in swagger_obj:
-            remove_com_vmware_from_dict(itm, depth+1)
-    if depth == 0 and len(keys_list) > 0:
-        while keys_list:
-            old_key = keys_list.pop()
-            new_key = old_key.replace('com.vmware.', '')
-            new_key = new_key.replace('$', '_')
-            try:
-                swagger_obj[new_key] = swagger_obj.pop(old_key)
-            except KeyError:
-                print('Could not find the Swagger Element :  {}'.format(old_key))
+    Removes the boolean 'required' flags the visitors put on the properties of a definition.
+    """
+    if 'properties' in type_object:
+        for property_value in type_object['properties'].values():
+            if isinstance(property_value.get('required'), bool):
+                del property_value['required']
+
+
+def post_process_spec(path_dict, type_dict, op_id_index=None, package_name=None):
+    """
+    Removes the path and method of the path objects and the boolean required flags of the definitions and,
+    if GENERATE_UNIQUE_OP_IDS is set, applies create_unique_op_ids, visiting every path object and definition once.
+    Model names don't need to be rewritten, they are final when the spec is built, see get_model_name.
+    :param op_id_index: OperationIdIndex to take the operation ids from, a new one if not given.
+    """
+    for http_operations in path_dict.values():
+        for operation_dict in http_operations.values():
+            operation_dict.pop('path', None)
+            operation_dict.pop('method', None)
+    if GENERATE_UNIQUE_OP_IDS:
+        create_unique_op_ids(path_dict, op_id_index, package_name)
+    for type_object in type_dict.values():
+        remove_required_flags(type_object)
 
 
 def create_camelized_op_id(path, http_method, operations_dict):
@@ -598,64 +1398,123 @@ def create_camelized_op_id(path, http_method, operations_dict):
     :param operations_dict:
     :return: new_op_id
     """
-    curr_op_id = operations_dict['operationId']
-    raw_op_id = curr_op_id.replace('-', '_')
-    new_op_id = raw_op_id
-    if '_' in raw_op_id:
-        raw_op_id_iter = iter(raw_op_id.split('_'))
-        new_op_id = next(raw_op_id_iter)
-        for new_op_id_element in raw_op_id_iter:
-            new_op_id += new_op_id_element.title()
-    ''' 
-        Removes query parameters form the path. 
-        Only path elements are used in operation ids
-    '''
-    paths_array = re.split('\?', path)
-    path = paths_array[0]
-    path_elements = path.replace('-', '_').split('/')
-    path_elements_iter = iter(path_elements)
-    for path_element in path_elements_iter:
-        if '{' in path_element:
-            continue
-        if 'com' == path_element or 'vmware' == path_element:
+    raw_op_id = operations_dict['operationId'].replace('-', '_')
+    words = raw_op_id.split('_')
+    words[1:] = [get_title(word) for word in words[1:]]
+    raw_op_id = raw_op_id.lower()
+    # Only path elements are used in operation ids, query parameters are removed.
+    for path_element in path.partition('?')[0].replace('-', '_').split('/'):
+        if '{' in path_element or path_element in ('com', 'vmware') or path_element.lower() == raw_op_id:
             continue
-        if path_element.lower() == raw_op_id.lower():
-            continue
-        if '_' in path_element:
-            sub_path_iter = iter(path_element.split('_'))
-            for sub_path_element in sub_path_iter:
-                new_op_id += sub_path_element.title()
-        else:
-            new_op_id += path_element.title()
-    return new_op_id
+        words.extend(get_title(word) for word in path_element.split('_'))
+    return ''.join(words)
 
 
-def create_unique_op_ids(path_dict):
+def get_title(word):
+    """
+    Memoized str.title, operation ids are built from a small vocabulary of path elements.
+    """
+    try:
+        return TITLES[word]
+    except KeyError:
+        title = TITLES[word] = word.title()
+        return title
+
+
+class OperationIdIndex(object):
+    """
+    Set-backed index of the operation ids in use.
+    An operation id which is taken gets the lowest free numeric suffix, e.g. listVcenterVm2,
+    and the collision is recorded. Paths are assigned in sorted order, so the result doesn't depend
+    on the order in which the operations were generated.
+
+    With package_names, the index is shared by all packages of a run (--global-unique-operation-ids).
+    Packages then take turns in sorted order, see turn.
+    """
+
+    def __init__(self, package_names=None):
+        self.used = set(RESERVED_OP_IDS)
+        self.suffixes = {}
+        self.collisions = []
+        self.pending_packages = sorted(package_names) if package_names is not None else None
+        self.turn_condition = threading.Condition()
+
+    def assign(self, path, http_method, operation_dict, package_name=None):
+        op_id = create_camelized_op_id(path, http_method, operation_dict)
+        unique_op_id = op_id
+        if op_id in self.used:
+            suffix = self.suffixes.get(op_id, 2)
+            while op_id + str(suffix) in self.used:
+                suffix += 1
+            self.suffixes[op_id] = suffix + 1
+            unique_op_id = op_id + str(suffix)
+            self.collisions.append({'package': package_name, 'path': path, 'method': http_method,
+                                    'requested': op_id, 'operationId': unique_op_id})
+        self.used.add(unique_op_id)
+        operation_dict['operationId'] = unique_op_id
+        return unique_op_id
+
+    @contextlib.contextmanager
+    def turn(self, package_name):
+        """
+        Waits until all packages sorted before package_name are done with the index.
+        """
+        self.wait_turn(package_name)
+        try:
+            yield self
+        finally:
+            self.release(package_name)
+
+    def wait_turn(self, package_name):
+        if self.pending_packages is None:
+            return
+        with self.turn_condition:
+            while self.pending_packages and self.pending_packages[0] != package_name \
+                    and package_name in self.pending_packages:
+                self.turn_condition.wait()
+
+    def release(self, package_name):
+        """
+        Gives up the turn of a package, also called for packages which failed before taking it.
+        """
+        if self.pending_packages is None:
+            return
+        with self.turn_condition:
+            if package_name in self.pending_packages:
+                self.pending_packages.remove(package_name)
+                self.turn_condition.notify_all()
+
+
+def create_unique_op_ids(path_dict, op_id_index=None, package_name=None):
     """
     Creates unique operation ids
     Takes the path dictionary as input parameter:
-    1. Iterates through all the http_operation array
+    1. Iterates through all the http_operation array in sorted order
     2. For every operation gets the current operation id
     3. Calls method to get the camelized operation id
-    4. Checks for uniqueness
+    4. Resolves collisions with the ids in op_id_index, see OperationIdIndex
     5. Updates the path dictionary with the unique operation id
-    
+
     :param path_dict:
+    :param op_id_index: defaults to a new OperationIdIndex
+    :return: the index
     """
-    op_id_list = ['get', 'set', 'list', 'add', 'run', 'start', 'stop',
-                  'restart', 'reset', 'cancel', 'create', 'update', 'delete']
-    for path, http_operation in path_dict.items():
-        for http_method, operation_dict in http_operation.items():
-            op_id_val = create_camelized_op_id(path, http_method, operation_dict)
-            if op_id_val not in op_id_list:
-                operation_dict['operationId'] = op_id_val
-                op_id_list.append(op_id_val)
+    if op_id_index is None:
+        op_id_index = OperationIdIndex()
+    for path in sorted(path_dict):
+        http_operations = path_dict[path]
+        for http_method in sorted(http_operations):
+            op_id_index.assign(path, http_method, http_operations[http_method], package_name)
+    return op_id_index
 
 
-def merge_dictionaries(x, y):
-    z = x.copy()   # start with x's keys and values
-    z.update(y)    # modifies z with y's keys and values & returns None
-    return z
+def write_op_id_report(file_name, collisions):
+    """
+    Writes the operation id collisions, sorted by package, path and method.
+    """
+    collisions = sorted(collisions, key=lambda collision: (collision['package'] or '', collision['path'],
+                                                           collision['method']))
+    write_json_data_to_file(file_name, {'collisions': collisions})
 
 
 def remove_query_params(path_dict):
@@ -705,41 +1564,99 @@ def remove_query_params(path_dict):
         Example :
                 /com/vmware/cis/tagging/tag-association/id:{tag_id}?~action=detach-tag-from-multiple-objects
                 /com/vmware/cis/tagging/tag-association/id:{tag_id}?~action=list-attached-objects
+
+    Paths are indexed once in a PathTrie and every base path is resolved together with all its query variants,
+    plain path first and query variants in sorted order, so the result doesn't depend on the order of path_dict.
     :param path_dict:
+    :return: dictionary with the sorted list of paths which kept their query parameters because of an absolute
+     duplicate under 'duplicates', and the groups of paths which only differ in the names of their path
+     variables, which Open API doesn't allow either, under 'conflicts'
+    """
+    path_trie = PathTrie()
+    for path in path_dict:
+        base_path, _, query = path.partition('?')
+        path_trie.insert(base_path, path if query else None)
+    duplicates = []
+    conflicts = []
+    for path_group in path_trie.iter_groups():
+        if len(path_group) > 1:
+            conflicts.append(sorted(path_group))
+        for base_path, query_paths in path_group.items():
+            if query_paths:
+                duplicates.extend(merge_query_paths(path_dict, base_path, query_paths))
+    return {'duplicates': sorted(duplicates), 'conflicts': sorted(conflicts)}
+
+
+def merge_query_paths(path_dict, base_path, query_paths):
+    """
+    Moves the query parameter of every query path to the parameters of its operations and merges them into
+    base_path, unless base_path already has one of their http methods.
+    :return: the query paths which were left unchanged
+    """
+    unresolved = []
+    http_operations = path_dict.get(base_path)
+    for query_path in sorted(query_paths):
+        query_operations = path_dict[query_path]
+        if http_operations is not None and not set(query_operations).isdisjoint(http_operations):
+            unresolved.append(query_path)
+            continue
+        name, _, value = query_path.partition('?')[2].partition('=')
+        for operation_dict in query_operations.values():
+            operation_dict['parameters'].append({'name': name, 'in': 'query', 'description': name + '=' + value,
+                                                 'required': True, 'type': 'string', 'enum': [value]})
+        del path_dict[query_path]
+        if http_operations is None:
+            http_operations = path_dict[base_path] = query_operations
+        else:
+            http_operations.update(query_operations)
+    return unresolved
+
+
+class PathTrie(object):
+    """
+    Trie of path templates keyed by path segment. Path variables are replaced with {}, so paths which
+    only differ in the names of their path variables, e.g. /vm/{vm} and /vm/{id}, share a node.
+    Every node with paths has a group, which maps each base path to the list of its query paths.
     """
-    paths_to_delete = []
-    for old_path, http_operations in path_dict.items():
-        if '?' in old_path:
-            paths_array = re.split('\?', old_path)
-            new_path = paths_array[0]
-            query_parameters = paths_array[1]
-            key_value = query_parameters.split('=')
-            q_param = {'name': key_value[0], 'in': 'query', 'description': key_value[0] + '=' + key_value[1],
-                       'required': True, 'type': 'string', 'enum': [key_value[1]]}
-            if new_path in path_dict:
-                new_path_operations = path_dict[new_path].keys()
-                path_operations = http_operations.keys()
-                if len(set(path_operations).intersection(new_path_operations)) < 1:
-                    for http_method, operation_dict in http_operations.items():
-                        operation_dict['parameters'].append(q_param)
-                    path_dict[new_path] = merge_dictionaries(http_operations, path_dict[new_path])
-                    paths_to_delete.append(old_path)
-            else:
-                for http_method, operation_dict in http_operations.items():
-                    operation_dict['parameters'].append(q_param)
-                path_dict[new_path] = path_dict.pop(old_path)
-    for path in paths_to_delete:
-        del path_dict[path]
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, base_path, query_path=None):
+        node = self.root
+        for segment in base_path.split('/'):
+            if '{' in segment:
+                segment = RE_PATH_VARIABLE.sub('{}', segment)
+            node = node.setdefault(segment, {})
+        query_paths = node.setdefault(PATH_TRIE_GROUP, {}).setdefault(base_path, [])
+        if query_path is not None:
+            query_paths.append(query_path)
+
+    def iter_groups(self):
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            for segment, child in node.items():
+                if segment is PATH_TRIE_GROUP:
+                    yield child
+                else:
+                    nodes.append(child)
 
 
 def process_output(path_dict, type_dict, output_dir, output_filename):
     description_map = load_description()
-    remove_com_vmware_from_dict(path_dict)
-    global GENERATE_UNIQUE_OP_IDS
-    if GENERATE_UNIQUE_OP_IDS:
-        create_unique_op_ids(path_dict)
-    remove_query_params(path_dict)
-    remove_com_vmware_from_dict(type_dict)
+    op_id_index = OP_ID_INDEX if OP_ID_INDEX is not None else OperationIdIndex()
+    with op_id_index.turn(output_filename), record_phase('post_process_spec', output_filename):
+        collision_count = len(op_id_index.collisions)
+        post_process_spec(path_dict, type_dict, op_id_index, output_filename)
+        OP_ID_COLLISIONS.extend(op_id_index.collisions[collision_count:])
+    with record_phase('remove_query_params', output_filename):
+        query_path_report = remove_query_params(path_dict)
+    if query_path_report['duplicates']:
+        eprint(output_filename + ': paths kept their query parameters because of duplicate operations: '
+               + ', '.join(query_path_report['duplicates']))
+    for conflict in query_path_report['conflicts']:
+        eprint(output_filename + ': paths only differ in the names of their path variables: ' + ', '.join(conflict))
     swagger_template = {'swagger': '2.0',
                         'info': {'description': description_map.get(output_filename, ''),
                                  'title': output_filename,
@@ -748,9 +1665,241 @@ def process_output(path_dict, type_dict, output_dir, output_filename):
                         'securityDefinitions': {'basic_auth': {'type': 'basic'}},
                         'basePath': '/rest', 'tags': [],
                         'schemes': ['https', 'http'],
-                        'paths': collections.OrderedDict(sorted(path_dict.items())),
-                        'definitions': collections.OrderedDict(sorted(type_dict.items()))}
-    write_json_data_to_file(output_dir + os.path.sep + output_filename + '.json', swagger_template)
+                        'paths': path_dict,
+                        'definitions': type_dict}
+    file_name = output_dir + os.path.sep + output_filename + '.json'
+    if SERVICE_FILTERS:
+        merge_existing_output(file_name, path_dict, type_dict)
+    if REUSE_COMPONENTS:
+        with record_phase('reuse_components', output_filename):
+            swagger_template['parameters'], swagger_template['responses'] = reuse_components(path_dict)
+    with record_phase('check_references', output_filename):
+        reference_report = check_references(swagger_template, prune=not KEEP_UNREFERENCED_DEFINITIONS)
+    for ref, referrers in sorted(reference_report['dangling'].items()):
+        eprint(output_filename + ': ' + ref + ' does not exist, referred to by ' + ', '.join(referrers))
+    count_stat('pruned_definitions', len(reference_report['pruned']))
+    count_stat('paths', len(path_dict))
+    count_stat('definitions', len(type_dict))
+    if SHARED_DEFINITIONS:
+        # written by write_shared_output
+        SHARED_DOCUMENTS[output_filename] = swagger_template
+        return
+    with record_phase('write', output_filename):
+        write_swagger_to_file(file_name, swagger_template)
+    if STATS is not None:
+        count_stat('output_bytes', os.path.getsize(file_name))
+
+
+class ComponentRegistry(object):
+    """
+    Process wide registry of the path parameters and responses built with --reuse-components, shared by all
+    package threads. Components with identical content are registered once, operations refer to them with
+    provisional $refs holding their index, e.g. #/responses/12, which reuse_components resolves.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.components = []
+
+    def intern(self, section, component):
+        """
+        :return: the provisional $ref of the component
+        """
+        key = (section, get_component_key(component))
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = len(self.components)
+                self.components.append((key, component))
+        return {'$ref': '#/%s/%d' % (section, index)}
+
+    def resolve(self, ref):
+        """
+        :return: tuple of the key and the component of a provisional $ref, None for other $refs
+        """
+        section, _, index = ref[len('#/'):].partition('/')
+        if section not in ('parameters', 'responses') or not index.isdigit():
+            return None
+        with self.lock:
+            return self.components[int(index)]
+
+    def collect(self, path):
+        """
+        :return: dict which maps the provisional $refs of a path object to their section and component
+        """
+        components = {}
+        for ref in iter_refs(path):
+            resolved = self.resolve(ref)
+            if resolved is not None:
+                components[ref] = (resolved[0][0], resolved[1])
+        return components
+
+
+COMPONENT_REGISTRY = ComponentRegistry()
+
+
+def get_component_key(component):
+    """
+    Returns a hashable equivalent of a component made of dicts, lists and immutable values.
+    """
+    if isinstance(component, dict):
+        return tuple(sorted((key, get_component_key(value)) for key, value in component.items()))
+    if isinstance(component, list):
+        return (list,) + tuple(get_component_key(value) for value in component)
+    return component
+
+
+def intern_component(section, component):
+    """
+    With --reuse-components, registers a path parameter or response as it is built and returns its
+    provisional $ref, see ComponentRegistry. Returns the component itself otherwise.
+    """
+    if not REUSE_COMPONENTS:
+        return component
+    return COMPONENT_REGISTRY.intern(section, component)
+
+
+def reuse_components(path_dict):
+    """
+    Moves the path parameters and the responses which several operations have with identical content into
+    the top level parameters and responses sections and refers to them with $refs, e.g. the not_found
+    response of all operations which document it the same way, or the {vm} parameter.
+    The components are interned as the operations are built, see intern_component. Those used by a single
+    operation are put back into it, as are the copies of the components of the operations merged from a
+    previous swagger file, which are interned here.
+    Components are named after the parameter name or the schema of the response. Variants of the same name
+    get a numeric suffix, the most used one first, so that names don't depend on the order of path_dict.
+    :return: parameters and responses sections
+    """
+    uses_by_ref = {'parameters': {}, 'responses': {}}
+    for http_operations in path_dict.values():
+        for operation_dict in http_operations.values():
+            parameters = operation_dict.get('parameters') or []
+            for index, parameter in enumerate(parameters):
+                if parameter.get('in') == 'path':
+                    parameter = parameters[index] = COMPONENT_REGISTRY.intern('parameters', parameter)
+                if '$ref' in parameter:
+                    uses_by_ref['parameters'].setdefault(parameter['$ref'], []).append((parameters, index))
+            responses = operation_dict.get('responses') or {}
+            for status_code, response in list(responses.items()):
+                if '$ref' not in response:
+                    response = responses[status_code] = COMPONENT_REGISTRY.intern('responses', response)
+                uses_by_ref['responses'].setdefault(response['$ref'], []).append((responses, status_code))
+    return (intern_components(uses_by_ref['parameters'], '#/parameters/', lambda parameter: parameter['name']),
+            intern_components(uses_by_ref['responses'], '#/responses/', get_response_component_name))
+
+
+def get_response_component_name(response):
+    ref = response.get('schema', {}).get('$ref')
+    if ref is None:
+        return 'response'
+    return ref.rpartition('/')[2]
+
+
+def intern_components(uses_by_ref, ref_prefix, get_name):
+    """
+    Replaces the provisional $refs of the components used more than once with $refs into a section, and
+    the others with a copy of the component.
+    :param uses_by_ref: dict which maps provisional $ref to the (container, key) pairs holding it
+    :return: the section
+    """
+    variants = {}
+    for ref, uses in uses_by_ref.items():
+        key, component = COMPONENT_REGISTRY.resolve(ref)
+        if len(uses) == 1:
+            container, use_key = uses[0]
+            container[use_key] = copy_schema(component)
+        else:
+            variants.setdefault(get_name(component), []).append((-len(uses), repr(key), ref))
+    section = {}
+    for name, name_variants in variants.items():
+        for index, (_, _, ref) in enumerate(sorted(name_variants)):
+            component_name = name if index == 0 else '%s_%d' % (name, index + 1)
+            while component_name in variants and index > 0:
+                component_name += '_'
+            section[component_name] = copy_schema(COMPONENT_REGISTRY.resolve(ref)[1])
+            for container, use_key in uses_by_ref[ref]:
+                container[use_key] = {'$ref': ref_prefix + component_name}
+    return section
+
+
+def inline_components(document):
+    """
+    Replaces the $refs into the parameters and responses sections of a document with the components.
+    """
+    parameters = document.pop('parameters', {})
+    responses = document.pop('responses', {})
+    for http_operations in document.get('paths', {}).values():
+        for operation_dict in http_operations.values():
+            operation_parameters = operation_dict.get('parameters') or []
+            for index, parameter in enumerate(operation_parameters):
+                ref = parameter.get('$ref', '')
+                if ref.startswith('#/parameters/'):
+                    operation_parameters[index] = copy_schema(parameters[ref[len('#/parameters/'):]])
+            operation_responses = operation_dict.get('responses') or {}
+            for status_code, response in list(operation_responses.items()):
+                ref = response.get('$ref', '')
+                if ref.startswith('#/responses/'):
+                    operation_responses[status_code] = copy_schema(responses[ref[len('#/responses/'):]])
+
+
+def read_shared_definitions(output_dir):
+    """
+    Returns the definitions of the shared definitions file of a previous run, an empty dict if there is none.
+    """
+    file_name = os.path.join(output_dir, SHARED_DEFINITIONS_FILE)
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name) as infile:
+        return json.load(infile).get('definitions', {})
+
+
+def localize_shared_definitions(document, shared_definitions):
+    """
+    Replaces the $refs of a document to the shared definitions file with $refs to copies of the definitions
+    in the document, along with the shared definitions they refer to.
+    """
+    prefix = SHARED_DEFINITIONS_FILE + '#/definitions/'
+    rewrite_refs(document, {prefix + name: '#/definitions/' + name for name in shared_definitions})
+    definitions = document.setdefault('definitions', {})
+    for name, definition in collect_referenced_definitions(document, shared_definitions).items():
+        definitions.setdefault(name, copy_schema(definition))
+
+
+def merge_existing_output(file_name, path_dict, type_dict):
+    """
+    With --services a package only has the operations of the selected services. Adds the paths and definitions of
+    the previously generated swagger file of the package, if any, which the new ones take precedence over.
+    """
+    if not os.path.isfile(file_name):
+        return
+    with open(file_name) as infile:
+        existing = json.load(infile)
+    # the sections of reused components are built again from the merged paths.
+    inline_components(existing)
+    # shared definitions are shared again by write_shared_output, if at all.
+    if any(ref.startswith(SHARED_DEFINITIONS_FILE + '#') for ref in iter_refs(existing)):
+        localize_shared_definitions(existing, read_shared_definitions(os.path.dirname(file_name)))
+    for path, http_operations in existing.get('paths', {}).items():
+        for http_method, operation_dict in http_operations.items():
+            path_dict.setdefault(path, {}).setdefault(http_method, operation_dict)
+    for type_name, definition in existing.get('definitions', {}).items():
+        type_dict.setdefault(type_name, definition)
+
+
+def write_api_file(output_dir, package_names):
+    """
+    Writes api.json, the list of packages which is used by UI to dynamically populate dropdown.
+    Runs limited by --packages or --services keep the packages generated by previous runs.
+    """
+    file_name = output_dir + os.path.sep + 'api.json'
+    files = list(package_names)
+    if (PACKAGE_FILTERS or SERVICE_FILTERS) and os.path.isfile(file_name):
+        with open(file_name) as infile:
+            existing_files = json.load(infile).get('files', [])
+        files = existing_files + [package_name for package_name in files if package_name not in existing_files]
+    write_json_data_to_file(file_name, {'files': files})
 
 
 def find_consumes(method_type):
@@ -771,35 +1920,63 @@ def extract_path_parameters(params, url):
     /vcenter/resource-pool/{resource-pool} to
     /vcenter/resource-pool/{resource_pool}
     """
-    # Regex to look for {} placeholders with a group to match only the parameter name
-    re_path_param = re.compile('{(.+?)}')
+    url_template = parse_url_template(url)
+    if not url_template:
+        return [], list(params), url
+    params_by_placeholder = index_params_by_placeholder(params)
+    path_param_indexes = set()
     path_params = []
-    other_params = list(params)
     new_url = url
-    for path_param_name_match in re_path_param.finditer(url):
-        path_param_placeholder = path_param_name_match.group(1)
-        path_param_info = None
-        for param in other_params:
-            if is_param_path_variable(param, path_param_placeholder):
-                path_param_info = param
-                if param.name != path_param_placeholder:
-                    new_url = new_url.replace(path_param_name_match.group(), '{' + param.name + '}')
+    for placeholder, path_param_placeholder in url_template:
+        path_param_index = None
+        for candidate in params_by_placeholder.get(path_param_placeholder, ()):
+            if candidate not in path_param_indexes:
+                path_param_index = candidate
                 break
-        if path_param_info is None:
+        if path_param_index is None:
             eprint('%s parameter from %s is not found among the operation\'s parameters'
                    % (path_param_placeholder, url))
-        else:
-            path_params.append(path_param_info)
-            other_params.remove(path_param_info)
+            continue
+        param = params[path_param_index]
+        if param.name != path_param_placeholder:
+            new_url = new_url.replace(placeholder, '{' + param.name + '}')
+        path_param_indexes.add(path_param_index)
+        path_params.append(param)
+    other_params = [param for index, param in enumerate(params) if index not in path_param_indexes]
     return path_params, other_params, new_url
 
 
-def is_param_path_variable(param, path_param_placeholder):
-    if param.name == path_param_placeholder:
-        return True
+def parse_url_template(url):
+    """
+    Returns the {} placeholders of a url as a tuple of (placeholder, parameter name) pairs.
+    Memoized, the same urls are parsed for every http method and every run of a cached operation.
+    """
+    try:
+        return URL_TEMPLATES[url]
+    except KeyError:
+        url_template = URL_TEMPLATES[url] = tuple((match.group(), match.group(1))
+                                                  for match in RE_PATH_PARAM.finditer(url))
+        return url_template
+
+
+def index_params_by_placeholder(params):
+    """
+    Maps every parameter name and PathVariable value to the positions of the parameters
+    it identifies, in parameter order.
+    """
+    params_by_placeholder = {}
+    for index, param in enumerate(params):
+        params_by_placeholder.setdefault(param.name, []).append(index)
+        path_variable = get_path_variable(param)
+        if path_variable is not None and path_variable != param.name:
+            params_by_placeholder.setdefault(path_variable, []).append(index)
+    return params_by_placeholder
+
+
+def get_path_variable(param):
     if 'PathVariable' not in param.metadata:
-        return False
-    return param.metadata['PathVariable'].elements['value'].string_value == path_param_placeholder
+        return None
+    return param.metadata['PathVariable'].elements['value'].string_value
 
 
 def flatten_query_param_spec(query_param_info, type_dict, structure_svc, enum_svc):
@@ -854,10 +2031,10 @@ def flatten_query_param_spec(query_param_info, type_dict, structure_svc, enum_sv
                         prop['items'] = property_value['items']
                         if '$ref' in property_value['items']:
                             ref = property_value['items']['$ref'].replace('#/definitions/', '')
-                            type_ref = type_dict[ref]
-                            prop['items'] = type_ref
-                            if 'description' in prop['items']:
-                                del prop['items']['description']
+                            # the item schema is inlined without its description. It is copied,
+                            # the definition itself is shared with the other operations using it.
+                            prop['items'] = copy_schema(type_dict[ref])
+                            prop['items'].pop('description', None)
                     if 'description' in property_value:
                         prop['description'] = property_value['description']
                 elif '$ref' in property_value:
@@ -888,7 +2065,7 @@ def flatten_query_param_spec(query_param_info, type_dict, structure_svc, enum_sv
     else:
         parameter_obj['in'] = 'query'
         parameter_obj['name'] = query_param_info.name
-        parameter_obj['description'] = query_param_info.documentation
+        parameter_obj['description'] = get_model_description(query_param_info.documentation)
         if 'required' not in parameter_obj:
             parameter_obj['required'] = True
         prop_array.append(parameter_obj)
@@ -925,7 +2102,7 @@ def wrap_body_params(service_name, operation_name, body_param_list, type_dict, s
     """
     # todo:
     # not unique enough. make it unique
-    wrapper_name = service_name + '_' + operation_name
+    wrapper_name = get_model_name(service_name + '_' + operation_name)
     body_obj = {'type': 'object'}
     properties_obj = {}
     body_obj['properties'] = properties_obj
@@ -936,7 +2113,7 @@ def wrap_body_params(service_name, operation_name, body_param_list, type_dict, s
         visit_type_category(param.type, parameter_obj, type_dict, structure_svc,
                             enum_svc)
         name_array.append(param.name)
-        parameter_obj['description'] = param.documentation
+        parameter_obj['description'] = get_model_description(param.documentation)
         properties_obj[param.name] = parameter_obj
         if 'required' not in parameter_obj:
             required.append(param.name)
@@ -1042,9 +2219,357 @@ def contains_rm_annotation(service_info):
     return True
 
 
+def update_metamodel_digest(digest, value):
+    """
+    Feeds a metamodel object into a hashlib object. Dicts are fed in key order and objects
+    by their public attributes, so that equal metamodel content always gives the same digest.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        digest.update(repr(value).encode('utf-8'))
+    elif isinstance(value, dict):
+        digest.update(b'{')
+        for key in sorted(value, key=str):
+            update_metamodel_digest(digest, key)
+            update_metamodel_digest(digest, value[key])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for item in value:
+            update_metamodel_digest(digest, item)
+        digest.update(b']')
+    elif isinstance(value, (set, frozenset)):
+        update_metamodel_digest(digest, sorted(value, key=str))
+    else:
+        digest.update(type(value).__name__.encode('utf-8'))
+        attributes = getattr(value, '__dict__', {})
+        update_metamodel_digest(digest, {name: attribute for name, attribute in attributes.items()
+                                         if not name.startswith('_')})
+
+
+def get_metamodel_digest(value):
+    digest = hashlib.sha1()
+    update_metamodel_digest(digest, value)
+    return digest.hexdigest()
+
+
+def collect_type_references(metamodel_type, references):
+    """
+    Adds the (resource type, type id) pairs of all user defined types used by a metamodel type to references.
+    """
+    if metamodel_type is None:
+        return
+    if metamodel_type.category == 'USER_DEFINED':
+        user_defined_type = metamodel_type.user_defined_type
+        if user_defined_type.resource_id is not None:
+            references.add((user_defined_type.resource_type, user_defined_type.resource_id))
+    elif metamodel_type.category == 'GENERIC':
+        generic_instantiation = metamodel_type.generic_instantiation
+        collect_type_references(generic_instantiation.element_type, references)
+        collect_type_references(generic_instantiation.map_key_type, references)
+        collect_type_references(generic_instantiation.map_value_type, references)
+
+
+def get_type_closure(references, structure_svc, enum_svc):
+    """
+    Returns the sorted (type id, content digest) pairs of all types transitively referenced by references.
+    """
+    closure = {}
+    pending = list(references)
+    while pending:
+        resource_type, type_name = pending.pop()
+        if type_name in closure or is_type_builtin(type_name):
+            continue
+        if type_name not in TYPE_DIGESTS:
+            type_references = set()
+            if resource_type == 'com.vmware.vapi.structure':
+                type_info = structure_svc.get(type_name)
+                for field in getattr(type_info, 'fields', None) or []:
+                    collect_type_references(field.type, type_references)
+            else:
+                type_info = enum_svc.get(type_name)
+            TYPE_REFERENCES[type_name] = type_references
+            TYPE_DIGESTS[type_name] = get_metamodel_digest(type_info)
+        closure[type_name] = TYPE_DIGESTS[type_name]
+        pending.extend(TYPE_REFERENCES[type_name])
+    return sorted(closure.items())
+
+
+def get_operation_cache_key(operation_info, http_method, url, service_name, operation_id, structure_svc, enum_svc):
+    """
+    Returns a hash of everything the path object and definitions of an operation are generated from:
+    the OperationInfo, its url and method and the content of all structures and enumerations it uses.
+    """
+    digest = hashlib.sha1()
+    update_metamodel_digest(digest, (OPERATION_CACHE_VERSION, TAG_SEPARATOR, REUSE_COMPONENTS, service_name,
+                                     operation_id, http_method, url))
+    update_metamodel_digest(digest, operation_info)
+    update_metamodel_digest(digest, get_type_closure(get_operation_type_references(operation_info),
+                                                     structure_svc, enum_svc))
+    return digest.hexdigest()
+
+
+def get_operation_type_references(operation_info):
+    """
+    Returns the (resource type, type id) pairs of the user defined types used by the parameters,
+    output and errors of an operation.
+    """
+    references = set()
+    for param in operation_info.params:
+        collect_type_references(param.type, references)
+    collect_type_references(operation_info.output.type, references)
+    for error in operation_info.errors:
+        references.add(('com.vmware.vapi.structure', error.structure_id))
+    return references
+
+
+def iter_refs(swagger_obj):
+    """
+    Yields the value of every $ref in a swagger object.
+    """
+    if isinstance(swagger_obj, dict):
+        for key, item in swagger_obj.items():
+            if key == '$ref' and isinstance(item, str):
+                yield item
+            elif isinstance(item, (dict, list)):
+                for ref in iter_refs(item):
+                    yield ref
+    elif isinstance(swagger_obj, list):
+        for item in swagger_obj:
+            for ref in iter_refs(item):
+                yield ref
+
+
+def collect_referenced_definitions(swagger_obj, type_dict, type_names=()):
+    """
+    Returns the definitions of type_dict which swagger_obj refers to, directly or through other definitions.
+    The definitions named in type_names are collected too, even if swagger_obj doesn't refer to them.
+    """
+    definitions = {}
+    pending = [swagger_obj]
+    for type_name in type_names:
+        if type_name not in definitions and type_name in type_dict:
+            definitions[type_name] = type_dict[type_name]
+            pending.append(type_dict[type_name])
+    while pending:
+        for ref in iter_refs(pending.pop()):
+            type_name = ref.replace('#/definitions/', '')
+            if type_name not in definitions and type_name in type_dict:
+                definitions[type_name] = type_dict[type_name]
+                pending.append(type_dict[type_name])
+    return definitions
+
+
+def index_refs(document):
+    """
+    Indexes the local $refs of a swagger document by what holds them: the path for the $refs of operations,
+    the $ref of the component for the $refs of definitions, parameters and responses.
+    :return: dict which maps every path and component to the set of local $refs it holds
+    """
+    edges = {}
+    for path, http_operations in document.get('paths', {}).items():
+        edges[path] = set(ref for ref in iter_refs(http_operations) if ref.startswith('#/'))
+    for section in COMPONENT_SECTIONS:
+        for name, component in (document.get(section) or {}).items():
+            edges['#/' + section + '/' + name] = set(ref for ref in iter_refs(component) if ref.startswith('#/'))
+    return edges
+
+
+def check_references(document, prune=True):
+    """
+    Walks the $ref graph of a swagger document from its paths, visiting every edge once.
+    :param prune: whether to remove the components which no path refers to, directly or indirectly
+    :return: dict with the names of the pruned components and, for every dangling $ref, the sorted
+             paths and components which hold it
+    """
+    edges = index_refs(document)
+    reachable = set()
+    dangling = {}
+    pending = [path for path in document.get('paths', {})]
+    while pending:
+        referrer = pending.pop()
+        for ref in edges[referrer]:
+            if ref in reachable:
+                continue
+            if ref not in edges:
+                dangling.setdefault(ref, set()).add(referrer)
+                continue
+            reachable.add(ref)
+            pending.append(ref)
+    pruned = []
+    if prune:
+        for section in COMPONENT_SECTIONS:
+            components = document.get(section) or {}
+            for name in sorted(components):
+                if '#/' + section + '/' + name not in reachable:
+                    del components[name]
+                    pruned.append(name)
+    return {'pruned': pruned, 'dangling': dict((ref, sorted(referrers)) for ref, referrers in dangling.items())}
+
+
+def rewrite_refs(swagger_obj, ref_map):
+    """
+    Replaces every $ref of a swagger object which is a key of ref_map with its value, in place.
+    """
+    pending = [swagger_obj]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            for key, item in node.items():
+                if key == '$ref' and isinstance(item, str):
+                    if item in ref_map:
+                        node[key] = ref_map[item]
+                elif isinstance(item, (dict, list)):
+                    pending.append(item)
+        elif isinstance(node, list):
+            pending.extend(item for item in node if isinstance(item, (dict, list)))
+
+
+def get_definition_digest(definition):
+    return hashlib.sha1(json.dumps(definition, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def get_referenced_names(definition):
+    return set(ref[len('#/definitions/'):] for ref in iter_refs(definition) if ref.startswith('#/definitions/'))
+
+
+def merge_identical_definitions(definitions):
+    """
+    Keeps a single copy of definitions which are structurally identical, under the first of their names
+    in sorted order. The others are replaced with a $ref to it, e.g. bench.service1.create_result with
+    a $ref to bench.service0.create_result, so that unrelated types with the same schema keep their names
+    and the $refs to them don't change.
+    :return: dict which maps every replaced name to the name it refers to
+    """
+    names_by_digest = {}
+    for name in sorted(definitions):
+        names_by_digest.setdefault(get_definition_digest(definitions[name]), []).append(name)
+    aliases = {}
+    for names in names_by_digest.values():
+        for name in names[1:]:
+            aliases[name] = names[0]
+            definitions[name] = {'$ref': '#/definitions/' + names[0]}
+    return aliases
+
+
+def share_definitions(documents, existing_definitions=None):
+    """
+    Moves the definitions which several packages have with identical content into a shared definitions
+    dictionary, to which the packages refer with external $refs to SHARED_DEFINITIONS_FILE.
+    A definition is only shared along with all definitions it refers to, as the shared file can't refer back
+    into a package. Structurally identical definitions are merged, in the shared file and in every package,
+    see merge_identical_definitions.
+    :param documents: dict which maps package name to swagger document, rewritten in place
+    :param existing_definitions: definitions of the shared file which packages of previous runs refer to,
+     a definition which has another content under the same name stays in the packages
+    :return: the shared definitions and a dict with the counts of shared and merged definitions
+    """
+    existing_definitions = existing_definitions or {}
+    digests = {}
+    for package_name, document in documents.items():
+        for name, definition in document['definitions'].items():
+            digests.setdefault(name, {}).setdefault(get_definition_digest(definition), []).append(package_name)
+    shared_names = set(name for name, packages_by_digest in digests.items()
+                       if len(packages_by_digest) == 1 and len(next(iter(packages_by_digest.values()))) > 1
+                       and (name not in existing_definitions
+                            or get_definition_digest(existing_definitions[name]) in packages_by_digest))
+    # definitions referring to a definition which stays in the packages stay in the packages as well.
+    references = {}
+    for document in documents.values():
+        for name, definition in document['definitions'].items():
+            if name in shared_names and name not in references:
+                references[name] = get_referenced_names(definition)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(shared_names):
+            if not references[name] <= shared_names:
+                shared_names.discard(name)
+                changed = True
+
+    shared_definitions = {}
+    for document in documents.values():
+        definitions = document['definitions']
+        for name in shared_names.intersection(definitions):
+            shared_definitions[name] = definitions.pop(name)
+    merged_count = len(merge_identical_definitions(shared_definitions))
+    ref_map = {}
+    for name in shared_names:
+        ref_map['#/definitions/' + name] = SHARED_DEFINITIONS_FILE + '#/definitions/' + name
+    for document in documents.values():
+        merged_count += len(merge_identical_definitions(document['definitions']))
+        rewrite_refs(document, ref_map)
+    return shared_definitions, {'shared_definitions': len(shared_definitions), 'merged_definitions': merged_count}
+
+
+def write_shared_output(output_dir):
+    """
+    Writes the package documents collected with --shared-definitions and the shared definitions file.
+    """
+    before = sum(len(encode_json(document['definitions'], 1)) for document in SHARED_DOCUMENTS.values())
+    # packages which this run doesn't generate may refer to any definition of the existing shared file.
+    existing_definitions = {}
+    if PACKAGE_FILTERS or SERVICE_FILTERS:
+        existing_definitions = read_shared_definitions(output_dir)
+    with record_phase('share_definitions'):
+        shared_definitions, report = share_definitions(SHARED_DOCUMENTS, existing_definitions)
+    after = len(encode_json(shared_definitions, 1)) + sum(len(encode_json(document['definitions'], 1))
+                                                          for document in SHARED_DOCUMENTS.values())
+    with record_phase('write'):
+        for package_name, document in SHARED_DOCUMENTS.items():
+            file_name = output_dir + os.path.sep + package_name + '.json'
+            write_swagger_to_file(file_name, document)
+            if STATS is not None:
+                STATS.count('output_bytes', os.path.getsize(file_name))
+        all_shared_definitions = dict(existing_definitions)
+        all_shared_definitions.update(shared_definitions)
+        write_swagger_to_file(output_dir + os.path.sep + SHARED_DEFINITIONS_FILE, {
+            'swagger': '2.0', 'info': {'title': 'common', 'version': '2.0.0'}, 'paths': {},
+            'definitions': all_shared_definitions})
+    report['definitions_bytes_saved'] = before - after
+    count_stat('definitions_bytes_saved', before - after)
+    print('Shared %(shared_definitions)d definitions in ' % report + SHARED_DEFINITIONS_FILE +
+          ', merged %(merged_definitions)d identical definitions, saved %(definitions_bytes_saved)d bytes' % report)
+    return report
+
+
 def get_path(operation_info, http_method, url, service_name, type_dict, structure_dict, enum_dict,
              operation_id, error_map):
-    documentation = operation_info.documentation
+    """
+    Builds the path object of an operation and adds the definitions it uses to type_dict.
+    If OPERATION_CACHE_DIR is set, both are reused from a previous run when neither the operation
+    nor any of the types it uses changed.
+    """
+    cache_file = None
+    if OPERATION_CACHE_DIR is not None:
+        cache_key = get_operation_cache_key(operation_info, http_method, url, service_name, operation_id,
+                                            structure_dict, enum_dict)
+        cache_file = os.path.join(OPERATION_CACHE_DIR, cache_key[:2], cache_key + '.pickle')
+        cached = read_cache_file(cache_file, ('path', 'definitions', 'components'))
+        if cached is not None:
+            for type_name, definition in cached['definitions'].items():
+                type_dict.setdefault(type_name, definition)
+            path = cached['path']
+            # provisional $refs of reused components are only valid in the process which registered them.
+            rewrite_refs(path, {ref: COMPONENT_REGISTRY.intern(section, component)['$ref']
+                                for ref, (section, component) in cached['components'].items()})
+            return path
+    path = build_operation_path(operation_info, http_method, url, service_name, type_dict, structure_dict,
+                                enum_dict, operation_id, error_map)
+    if cache_file is not None:
+        # the definitions of all types the operation uses are added to type_dict, also those that end up
+        # unreferenced (like flattened query parameter specs), for a warm run to give the same type_dict.
+        type_names = [get_model_name(type_name) for type_name, _ in
+                      get_type_closure(get_operation_type_references(operation_info), structure_dict, enum_dict)]
+        components = COMPONENT_REGISTRY.collect(path)
+        definitions = collect_referenced_definitions([path] + [component for _, component in components.values()],
+                                                    type_dict, type_names)
+        write_cache_file(cache_file, {'path': path, 'definitions': definitions, 'components': components})
+    return path
+
+
+def build_operation_path(operation_info, http_method, url, service_name, type_dict, structure_dict, enum_dict,
+                         operation_id, error_map):
+    documentation = get_model_description(operation_info.documentation)
     params = operation_info.params
     errors = operation_info.errors
     output = operation_info.output
@@ -1068,9 +2593,38 @@ def get_path(operation_info, http_method, url, service_name, type_dict, structur
 
 
 def process_service_urls(package_name, service_urls, output_dir, structure_dict, enum_dict,
-                         service_dict, service_url_dict, error_map, base_url):
+                         service_dict, service_url_dict, error_map, base_url, service_operations_dict=None):
 
+    STATS_STATE.package = package_name
+    try:
+        if PROFILE_DIR is not None and OP_ID_INDEX is not None:
+            # packages are profiled one at a time, they must take PROFILE_LOCK in the order of their turns.
+            OP_ID_INDEX.wait_turn(package_name)
+        with profile_package(package_name):
+            generate_package(package_name, service_urls, output_dir, structure_dict, enum_dict, service_dict,
+                             service_url_dict, error_map, base_url, service_operations_dict)
+    finally:
+        STATS_STATE.package = None
+        # packages sorted after a failed one must not wait for it.
+        if OP_ID_INDEX is not None:
+            OP_ID_INDEX.release(package_name)
+
+
+def generate_package(package_name, service_urls, output_dir, structure_dict, enum_dict, service_dict,
+                     service_url_dict, error_map, base_url, service_operations_dict):
     print('processing package ' + package_name + os.linesep)
+    with record_phase('conversion', package_name):
+        path_dict, type_dict = convert_services(service_urls, structure_dict, enum_dict, service_dict,
+                                                service_url_dict, error_map, base_url, service_operations_dict)
+    process_output(path_dict, type_dict, output_dir, package_name)
+
+
+def convert_services(service_urls, structure_dict, enum_dict, service_dict, service_url_dict, error_map, base_url,
+                     service_operations_dict):
+    """
+    Builds the path objects of all operations of the services and the definitions they use.
+    :return: path dictionary and type dictionary
+    """
     type_dict = {}
     path_list = []
     for service_url in service_urls:
@@ -1078,6 +2632,7 @@ def process_service_urls(package_name, service_urls, output_dir, structure_dict,
         service_info = service_dict.get(service_name, None)
         if service_info is None:
             continue
+        count_stat('services')
 
         if contains_rm_annotation(service_info):
             for operation in service_info.operations.values():
@@ -1088,10 +2643,15 @@ def process_service_urls(package_name, service_urls, output_dir, structure_dict,
                 path = get_path(operation_info, method, url, service_name, type_dict, structure_dict, enum_dict,
                                 operation_id, error_map)
                 path_list.append(path)
+                count_stat('operations')
             continue
 
         # use rest navigation service to get the REST mappings for a service.
-        service_operations = get_json(service_url + '?~method=OPTIONS', False)
+        # main prefetches them for all packages, fall back to fetching it here otherwise.
+        if service_operations_dict is not None and service_url in service_operations_dict:
+            service_operations = service_operations_dict[service_url]
+        else:
+            service_operations = get_json(service_url + '?~method=OPTIONS', False)
         if service_operations is None:
             continue
 
@@ -1119,9 +2679,74 @@ def process_service_urls(package_name, service_urls, output_dir, structure_dict,
             path = get_path(operation_info, method, url, service_name, type_dict, structure_dict, enum_dict,
                             operation_id, error_map)
             path_list.append(path)
-    path_dict = convert_path_list_to_path_map(path_list)
-    cleanup(path_dict=path_dict, type_dict=type_dict)
-    process_output(path_dict, type_dict, output_dir, package_name)
+            count_stat('operations')
+    return convert_path_list_to_path_map(path_list), type_dict
+
+
+def init_package_worker(settings, structure_dict, enum_dict, service_dict, service_url_dict, error_map, base_url,
+                        service_operations_dict):
+    """
+    Initializer of the --processes pool. Receives the module settings and the metamodel dictionaries
+    once per worker process instead of once per package.
+    """
+    globals().update(settings)
+    global STATS
+    if STATS_FILE is not None:
+        STATS = StatsRecorder()
+    global PACKAGE_WORKER_STATE
+    PACKAGE_WORKER_STATE = (structure_dict, enum_dict, service_dict, service_url_dict, error_map, base_url,
+                            service_operations_dict)
+
+
+def process_package_in_worker(package_name, service_urls, output_dir):
+    """
+    Generates a package in a worker process.
+    :return: the operation id collisions, the --stats, the --visitor-stats and, with --shared-definitions, the swagger
+     document of the package, which are collected in the parent process
+    """
+    structure_dict, enum_dict, service_dict, service_url_dict, error_map, base_url, service_operations_dict = \
+        PACKAGE_WORKER_STATE
+    del OP_ID_COLLISIONS[:]
+    global VISITOR_STATS
+    if VISITOR_STATS_FILE is not None:
+        VISITOR_STATS = VisitorStats()
+        VISITOR_STATS.install()
+    try:
+        process_service_urls(package_name, service_urls, output_dir, structure_dict, enum_dict, service_dict,
+                             service_url_dict, error_map, base_url, service_operations_dict)
+    finally:
+        if VISITOR_STATS is not None:
+            VISITOR_STATS.uninstall()
+    package_stats = STATS.get_package(package_name) if STATS is not None else None
+    visitor_stats = VISITOR_STATS.report() if VISITOR_STATS is not None else None
+    return list(OP_ID_COLLISIONS), package_stats, visitor_stats, SHARED_DOCUMENTS.pop(package_name, None)
+
+
+def process_packages_in_processes(package_dict, output_dir, structure_dict, enum_dict, service_dict,
+                                  service_url_dict, error_map, base_url, service_operations_dict):
+    """
+    Generates every package in a pool of PROCESSES worker processes, so that conversion and
+    serialization are not serialized by the GIL.
+    """
+    settings = {name: globals()[name] for name in WORKER_SETTINGS}
+    with futures.ProcessPoolExecutor(max_workers=PROCESSES, initializer=init_package_worker,
+                                     initargs=(settings, structure_dict, enum_dict, service_dict, service_url_dict,
+                                               error_map, base_url, service_operations_dict)) as executor:
+        future_to_package = {executor.submit(process_package_in_worker, package, service_urls, output_dir): package
+                             for package, service_urls in package_dict.items()}
+        for future in futures.as_completed(future_to_package):
+            try:
+                op_id_collisions, package_stats, visitor_stats, document = future.result()
+                OP_ID_COLLISIONS.extend(op_id_collisions)
+                if document is not None:
+                    SHARED_DOCUMENTS[future_to_package[future]] = document
+                if package_stats is not None:
+                    STATS.add_package(future_to_package[future], package_stats)
+                if visitor_stats is not None:
+                    VISITOR_STATS.merge(visitor_stats)
+            except Exception as ex:
+                eprint('Error processing package ' + future_to_package[future])
+                eprint(ex)
 
 
 def get_input_params():
@@ -1140,6 +2765,52 @@ def get_input_params():
     parser.add_argument('-k', '--insecure', action='store_true', help='Bypass SSL certificate validation')
     parser.add_argument("-uo", "--unique-operation-ids", required=False, nargs='?', const=True, default=False,
                         help="Pass this parameter to generate Unique Operation Ids.")
+    parser.add_argument('--global-unique-operation-ids', action='store_true',
+                        help='Make operation ids unique across all packages instead of within each package.'
+                             ' Implies --unique-operation-ids')
+    parser.add_argument('--op-id-report', help='Write the operation id collisions which were resolved by'
+                                               ' adding a numeric suffix to this JSON file')
+    parser.add_argument('--http-pool-size', type=int, default=10,
+                        help='Number of keep-alive connections kept open to the rest navigation API')
+    parser.add_argument('--http-concurrency', type=int, default=8,
+                        help='Maximum number of concurrent requests to the metadata and rest navigation APIs')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='Generate packages in this many worker processes instead of threads')
+    parser.add_argument('--packages', nargs='+', default=(),
+                        help='Only generate the packages matching these glob patterns, e.g. vcenter or vc*')
+    parser.add_argument('--services', nargs='+', default=(),
+                        help='Only generate the services matching these glob patterns, e.g. com.vmware.vcenter.vm.*.'
+                             ' Their operations are merged into the existing swagger file of their package')
+    parser.add_argument('--lazy-metamodel', action='store_true',
+                        help='Download metamodel components when a type or service of them is first needed instead'
+                             ' of downloading all of them upfront')
+    parser.add_argument('--metamodel-cache', help='Directory in which downloaded components are cached. Components'
+                                                  ' are only downloaded again if their fingerprint changed')
+    parser.add_argument('--operation-cache', help='Directory in which generated operations are cached. Operations'
+                                                  ' are only converted again if they or the types they use changed')
+    parser.add_argument('--shared-definitions', action='store_true',
+                        help='Move the definitions used by several packages to a shared ' + SHARED_DEFINITIONS_FILE +
+                             ' file and merge structurally identical definitions')
+    parser.add_argument('--reuse-components', action='store_true',
+                        help='Move path parameters and responses which several operations share into the top level'
+                             ' parameters and responses sections')
+    parser.add_argument('--keep-unreferenced-definitions', action='store_true',
+                        help='Keep the definitions which no operation refers to in the swagger files')
+    parser.add_argument('--http-cache', help='Directory in which rest navigation documents are cached with their'
+                                             ' validators. Cached documents are revalidated with conditional requests')
+    parser.add_argument('--compact-json', action='store_true', help='Write swagger files without indentation')
+    parser.add_argument('--json-backend', choices=('auto', 'json', 'orjson'), default='auto',
+                        help='JSON encoder used to write swagger files. auto uses orjson if it is installed')
+    parser.add_argument('--stats', help='Write the wall and CPU time of every phase and per package counters'
+                                        ' to this JSON file')
+    parser.add_argument('--visitor-stats', help='Count the calls of the type conversion functions and time the'
+                                                ' conversion of every type, and write them to this JSON file')
+    parser.add_argument('--profile-dir', help='Profile every package with cProfile and write <package>.pstats files'
+                                              ' to this directory. Packages are then generated one at a time')
+    parser.add_argument('--save-snapshot', help='Write the downloaded metamodel and rest navigation data to this'
+                                                ' file so that later runs can use --from-snapshot')
+    parser.add_argument('--from-snapshot', help='Generate from a snapshot written by --save-snapshot instead of'
+                                                ' connecting to vCenter Server')
     args = parser.parse_args()
     metadata_url = args.metadata_url
     rest_navigation_url = args.rest_navigation_url
@@ -1149,18 +2820,65 @@ def get_input_params():
             metadata_url = 'https://%s/api' % vcip
         if rest_navigation_url is None:
             rest_navigation_url = 'https://%s/rest' % vcip
-    if metadata_url is None or rest_navigation_url is None:
+    if args.from_snapshot is None and (metadata_url is None or rest_navigation_url is None):
         raise ValueError('metadataUrl and restNavigationUrl are required parameters')
-    metadata_url = metadata_url.rstrip('/')
-    rest_navigation_url = rest_navigation_url.rstrip('/')
+    if metadata_url is not None:
+        metadata_url = metadata_url.rstrip('/')
+    if rest_navigation_url is not None:
+        rest_navigation_url = rest_navigation_url.rstrip('/')
     output_dir = args.output
     if output_dir is None:
         output_dir = os.getcwd()
     verify = not args.insecure
     global GENERATE_UNIQUE_OP_IDS
-    GENERATE_UNIQUE_OP_IDS = args.unique_operation_ids
+    GENERATE_UNIQUE_OP_IDS = args.unique_operation_ids or args.global_unique_operation_ids
+    global GLOBAL_UNIQUE_OP_IDS, OP_ID_REPORT
+    GLOBAL_UNIQUE_OP_IDS = args.global_unique_operation_ids
+    OP_ID_REPORT = args.op_id_report
     global TAG_SEPARATOR
     TAG_SEPARATOR = args.tag_separator
+    global HTTP_POOL_SIZE
+    HTTP_POOL_SIZE = args.http_pool_size
+    global HTTP_CONCURRENCY
+    HTTP_CONCURRENCY = args.http_concurrency
+    global PROCESSES
+    PROCESSES = args.processes
+    global METAMODEL_CACHE_DIR
+    METAMODEL_CACHE_DIR = args.metamodel_cache
+    global LAZY_METAMODEL
+    LAZY_METAMODEL = args.lazy_metamodel
+    global PACKAGE_FILTERS, SERVICE_FILTERS
+    PACKAGE_FILTERS = tuple(args.packages)
+    SERVICE_FILTERS = tuple(args.services)
+    global SHARED_DEFINITIONS, REUSE_COMPONENTS
+    SHARED_DEFINITIONS = args.shared_definitions
+    REUSE_COMPONENTS = args.reuse_components
+    global KEEP_UNREFERENCED_DEFINITIONS
+    KEEP_UNREFERENCED_DEFINITIONS = args.keep_unreferenced_definitions
+    global COMPACT_JSON, JSON_BACKEND
+    COMPACT_JSON = args.compact_json
+    JSON_BACKEND = args.json_backend
+    if JSON_BACKEND == 'orjson' and orjson is None:
+        raise ValueError('--json-backend orjson requires the orjson package')
+    global OPERATION_CACHE_DIR
+    OPERATION_CACHE_DIR = args.operation_cache
+    global HTTP_CACHE_DIR
+    HTTP_CACHE_DIR = args.http_cache
+    global STATS_FILE, STATS
+    STATS_FILE = args.stats
+    if STATS_FILE is not None:
+        STATS = StatsRecorder()
+    global VISITOR_STATS_FILE, VISITOR_STATS, PROFILE_DIR
+    VISITOR_STATS_FILE = args.visitor_stats
+    if VISITOR_STATS_FILE is not None:
+        VISITOR_STATS = VisitorStats()
+    PROFILE_DIR = args.profile_dir
+    global SNAPSHOT_INPUT, SNAPSHOT_OUTPUT
+    SNAPSHOT_INPUT = args.from_snapshot
+    SNAPSHOT_OUTPUT = args.save_snapshot
+    if SNAPSHOT_OUTPUT is not None and (PACKAGE_FILTERS or SERVICE_FILTERS):
+        # the snapshot would only hold the selected services, later runs couldn't tell it is partial.
+        raise ValueError('--save-snapshot cannot be combined with --packages or --services')
     return metadata_url, rest_navigation_url, output_dir, verify
 
 
@@ -1170,11 +2888,6 @@ def get_component_service(connector):
     return component_svc
 
 
-def get_service_urls_from_rest_navigation(rest_navigation_url, verify):
-    component_services_urls = get_component_services_urls(rest_navigation_url, verify)
-    return get_all_services_urls(component_services_urls, verify)
-
-
 def categorize_service_urls_by_package_names(service_urls_map, base_url):
     package_dict = {}
     for service_url in service_urls_map:
@@ -1224,27 +2937,163 @@ def find_url_method(opinfo):
 
 
 def populate_dicts(component_svc, enumeration_dict, structure_dict, service_dict, service_urls_map, base_url):
+    """
+    Downloads all components on a pool of HTTP_CONCURRENCY threads. The components are merged into the
+    dictionaries by the calling thread in the order of component_svc.list(), so that a name defined by several
+    components always resolves to the same one, each as soon as it and the components before it are downloaded.
+    """
     components = component_svc.list()
-    for component in components:
-        component_data = component_svc.get(component)
-        component_packages = component_data.info.packages
-        for package in component_packages:
-            package_info = component_packages.get(package)
-            for enumeration, enumeration_info in package_info.enumerations.items():
-                enumeration_dict[enumeration] = enumeration_info
-            for structure, structure_info in package_info.structures.items():
-                structure_dict[structure] = structure_info
-                for enum_name, enum_info in structure_info.enumerations.items():
-                    enumeration_dict[enum_name] = enum_info
-            for service, service_info in package_info.services.items():
-                service_dict[service] = service_info
-                service_urls_map[get_service_url_from_service_id(base_url, service)] = service
-                for structure_name, structure_info in service_info.structures.items():
-                    structure_dict[structure_name] = structure_info
-                    for et1, et_info1 in structure_info.enumerations.items():
-                        enumeration_dict[et1] = et_info1
-                for enum_name, enum_info in service_info.enumerations.items():
-                    enumeration_dict[enum_name] = enum_info
+    with futures.ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY) as executor:
+        pending = [executor.submit(fetch_component, component_svc, component) for component in components]
+        for future in pending:
+            merge_component_data(future.result(), enumeration_dict, structure_dict, service_dict, service_urls_map,
+                                 base_url)
+
+
+def fetch_component(component_svc, component_id):
+    """
+    Returns the ComponentData of a component. If METAMODEL_CACHE_DIR is set, the fingerprint of the
+    component is fetched first and the component is only downloaded if it differs from the fingerprint
+    of the cached copy.
+    """
+    if METAMODEL_CACHE_DIR is None:
+        return component_svc.get(component_id)
+    fingerprint = component_svc.fingerprint(component_id)
+    cache_file = os.path.join(METAMODEL_CACHE_DIR, component_id + '.pickle')
+    cached = read_cache_file(cache_file, ('fingerprint', 'component_data'))
+    if cached is not None and cached['fingerprint'] == fingerprint:
+        return cached['component_data']
+    component_data = component_svc.get(component_id)
+    write_cache_file(cache_file, {'fingerprint': fingerprint, 'component_data': component_data})
+    return component_data
+
+
+def merge_component_data(component_data, enumeration_dict, structure_dict, service_dict, service_urls_map, base_url):
+    component_packages = component_data.info.packages
+    for package in component_packages:
+        package_info = component_packages.get(package)
+        for enumeration, enumeration_info in package_info.enumerations.items():
+            enumeration_dict[enumeration] = enumeration_info
+        for structure, structure_info in package_info.structures.items():
+            structure_dict[structure] = structure_info
+            for enum_name, enum_info in structure_info.enumerations.items():
+                enumeration_dict[enum_name] = enum_info
+        for service, service_info in package_info.services.items():
+            service_dict[service] = service_info
+            service_urls_map[get_service_url_from_service_id(base_url, service)] = service
+            for structure_name, structure_info in service_info.structures.items():
+                structure_dict[structure_name] = structure_info
+                for et1, et_info1 in structure_info.enumerations.items():
+                    enumeration_dict[et1] = et_info1
+            for enum_name, enum_info in service_info.enumerations.items():
+                enumeration_dict[enum_name] = enum_info
+
+
+class LazyMetamodel(object):
+    """
+    Fetches components only when one of their enumerations, structures or services is first looked up,
+    instead of populate_dicts downloading all of them upfront.
+    A name is looked up in the not yet loaded components whose id is a prefix of it, longest first,
+    e.g. com.vmware.vcenter.vm.hardware.info in com.vmware.vcenter, and in all remaining components if
+    none of them has it. Concurrent lookups of the same component wait for a single download.
+    enumeration_dict, structure_dict and service_dict are read-only mappings usable in place of the
+    dictionaries filled by populate_dicts.
+    """
+
+    def __init__(self, component_svc, component_ids, base_url):
+        self.component_svc = component_svc
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.pending = set(component_ids)
+        self.loads = {}
+        self.enumerations = {}
+        self.structures = {}
+        self.services = {}
+        self.service_urls = {}
+        self.enumeration_dict = LazyMetamodelDict(self, self.enumerations)
+        self.structure_dict = LazyMetamodelDict(self, self.structures)
+        self.service_dict = LazyMetamodelDict(self, self.services)
+
+    def get_candidate_components(self, name):
+        with self.lock:
+            return sorted((component_id for component_id in self.pending if name.startswith(component_id + '.')),
+                          key=len, reverse=True)
+
+    def load(self, component_id):
+        with self.lock:
+            future = self.loads.get(component_id)
+            loader = future is None
+            if loader:
+                future = self.loads[component_id] = futures.Future()
+        if not loader:
+            future.result()
+            return
+        try:
+            component_data = fetch_component(self.component_svc, component_id)
+        except Exception as ex:
+            # not retried, lookups of its types fail like lookups of unknown types.
+            eprint('Error fetching component ' + component_id)
+            eprint(ex)
+            component_data = None
+        try:
+            with self.lock:
+                self.pending.discard(component_id)
+                if component_data is not None:
+                    merge_component_data(component_data, self.enumerations, self.structures, self.services,
+                                         self.service_urls, self.base_url)
+        except BaseException as ex:
+            # concurrent lookups of the component fail the same way instead of waiting forever.
+            future.set_exception(ex)
+            raise
+        count_stat('components_loaded')
+        future.set_result(None)
+
+    def load_all(self):
+        with self.lock:
+            component_ids = list(self.pending)
+        with futures.ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY) as executor:
+            for _ in executor.map(self.load, component_ids):
+                pass
+
+    def resolve(self, entries, name):
+        if name in entries:
+            return entries[name]
+        for component_id in self.get_candidate_components(name):
+            self.load(component_id)
+            if name in entries:
+                return entries[name]
+        if self.pending:
+            # defeats the lazy loading, e.g. of runs limited by --packages or --services, so it is reported.
+            eprint(name + ' is not in the components matching it, loading all %d remaining components'
+                   % len(self.pending))
+            count_stat('lazy_metamodel_fallbacks')
+            self.load_all()
+        return entries.get(name)
+
+
+class LazyMetamodelDict(collections.abc.Mapping):
+    """
+    Read-only mapping over one kind of metamodel entries of a LazyMetamodel.
+    Iterating loads all components.
+    """
+
+    def __init__(self, metamodel, entries):
+        self.metamodel = metamodel
+        self.entries = entries
+
+    def __getitem__(self, name):
+        value = self.metamodel.resolve(self.entries, name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self):
+        self.metamodel.load_all()
+        return iter(list(self.entries))
+
+    def __len__(self):
+        self.metamodel.load_all()
+        return len(self.entries)
 
 
 def get_service_url_from_service_id(base_url, service_id):
@@ -1264,36 +3113,103 @@ def main():
     # Maps service url to service id
     service_urls_map = {}
 
-    start = timeit.default_timer()
-    print('Trying to connect ' + metadata_api_url)
-    session = requests.session()
-    session.verify = False
-    connector = get_requests_connector(session, url=metadata_api_url)
-    print('Connected to ' + metadata_api_url)
-    component_svc = get_component_service(connector)
-    populate_dicts(component_svc, enumeration_dict, structure_dict, service_dict, service_urls_map, rest_navigation_url)
-
-    service_urls_map = get_service_urls_from_rest_navigation(rest_navigation_url, verify)
-    package_dict = categorize_service_urls_by_package_names(service_urls_map, rest_navigation_url)
+    start, cpu_start = timeit.default_timer(), time.process_time()
+    if SNAPSHOT_INPUT is not None:
+        print('Loading metamodel snapshot ' + SNAPSHOT_INPUT)
+        with record_phase('snapshot_load'):
+            snapshot_metadata_url, snapshot_rest_navigation_url, enumeration_dict, structure_dict, service_dict, \
+                service_urls_map, service_operations_dict = load_snapshot(SNAPSHOT_INPUT)
+        # urls given on the command line win, so a snapshot can be replayed against another host name.
+        if metadata_api_url is None:
+            metadata_api_url = snapshot_metadata_url
+        if rest_navigation_url is None:
+            rest_navigation_url = snapshot_rest_navigation_url
+        service_urls_map = select_service_urls(service_urls_map)
+        package_dict = categorize_service_urls_by_package_names(service_urls_map, rest_navigation_url)
+    else:
+        print('Trying to connect ' + metadata_api_url)
+        # snapshots and worker processes need the whole metamodel. --packages and --services imply
+        # --lazy-metamodel, the selected services may use types of any component.
+        filtered = bool(PACKAGE_FILTERS or SERVICE_FILTERS)
+        lazy_metamodel = (LAZY_METAMODEL or filtered) and SNAPSHOT_OUTPUT is None and PROCESSES == 0
+        if LAZY_METAMODEL and not lazy_metamodel:
+            eprint('--lazy-metamodel is ignored with --save-snapshot and --processes')
+        with record_phase('metamodel_fetch'):
+            session = requests.session()
+            session.verify = False
+            connector = get_requests_connector(session, url=metadata_api_url)
+            print('Connected to ' + metadata_api_url)
+            component_svc = get_component_service(connector)
+            if lazy_metamodel:
+                metamodel = LazyMetamodel(component_svc, component_svc.list(), rest_navigation_url)
+                enumeration_dict, structure_dict, service_dict = \
+                    metamodel.enumeration_dict, metamodel.structure_dict, metamodel.service_dict
+            else:
+                # the service urls of the metamodel are superseded by the ones rest navigation discovers.
+                populate_dicts(component_svc, enumeration_dict, structure_dict, service_dict, {},
+                               rest_navigation_url)
+
+        # packages are categorized while rest navigation is still being crawled.
+        with record_phase('discovery'):
+            package_dict = categorize_service_urls_by_package_names(
+                collect_service_urls(iter_service_urls_from_rest_navigation(rest_navigation_url, verify),
+                                     service_urls_map), rest_navigation_url)
+        with record_phase('options_prefetch'):
+            service_operations_dict = prefetch_service_operations(service_urls_map, service_dict, service_urls_map)
+        if SNAPSHOT_OUTPUT is not None:
+            with record_phase('snapshot_save'):
+                save_snapshot(SNAPSHOT_OUTPUT, metadata_api_url, rest_navigation_url, enumeration_dict,
+                              structure_dict, service_dict, service_urls_map, service_operations_dict)
+            print('Saved metamodel snapshot ' + SNAPSHOT_OUTPUT)
     error_map = build_error_map()
 
-    threads = []
-    for package, service_urls in six.iteritems(package_dict):
-        worker = threading.Thread(target=process_service_urls, args=(
-            package, service_urls, output_dir, structure_dict, enumeration_dict, service_dict, service_urls_map
-            , error_map, rest_navigation_url))
-        worker.daemon = True
-        worker.start()
-        threads.append(worker)
-    for worker in threads:
-        worker.join()
-
-    # api.json contains list of packages which is used by UI to dynamically populate dropdown.
-    api_files = {'files': list(package_dict.keys())}
-    write_json_data_to_file(output_dir + os.path.sep + 'api.json', api_files)
+    if GLOBAL_UNIQUE_OP_IDS:
+        if PROCESSES > 0:
+            eprint('--global-unique-operation-ids is not supported with --processes,'
+                   ' operation ids are only unique within each package')
+        else:
+            global OP_ID_INDEX
+            OP_ID_INDEX = OperationIdIndex(package_dict.keys())
+
+    # worker processes install their own instrumentation.
+    if VISITOR_STATS is not None and PROCESSES == 0:
+        VISITOR_STATS.install()
+    with record_phase('packages'):
+        if PROCESSES > 0:
+            process_packages_in_processes(package_dict, output_dir, structure_dict, enumeration_dict, service_dict,
+                                          service_urls_map, error_map, rest_navigation_url, service_operations_dict)
+        else:
+            threads = []
+            for package, service_urls in six.iteritems(package_dict):
+                worker = threading.Thread(target=process_service_urls, args=(
+                    package, service_urls, output_dir, structure_dict, enumeration_dict, service_dict,
+                    service_urls_map, error_map, rest_navigation_url, service_operations_dict))
+                worker.daemon = True
+                worker.start()
+                threads.append(worker)
+            for worker in threads:
+                worker.join()
+
+    if SHARED_DEFINITIONS:
+        write_shared_output(output_dir)
+
+    if VISITOR_STATS is not None:
+        if PROCESSES == 0:
+            VISITOR_STATS.uninstall()
+        write_json_data_to_file(VISITOR_STATS_FILE, VISITOR_STATS.report())
+
+    if OP_ID_COLLISIONS:
+        print('Resolved ' + str(len(OP_ID_COLLISIONS)) + ' operation id collisions')
+    if OP_ID_REPORT is not None:
+        write_op_id_report(OP_ID_REPORT, OP_ID_COLLISIONS)
+
+    write_api_file(output_dir, package_dict.keys())
     stop = timeit.default_timer()
     print('Generated swagger files at ' + output_dir + ' for ' + metadata_api_url + ' in ' + str(
         stop - start) + ' seconds')
+    if STATS is not None:
+        STATS.phases['total'] = {'wall_seconds': stop - start, 'cpu_seconds': time.process_time() - cpu_start}
+        write_stats_report(STATS_FILE)
 
 
 if __name__ == '__main__':